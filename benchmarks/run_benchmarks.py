@@ -0,0 +1,174 @@
+"""Benchmarks of the estimator and of the scene.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --only estimator
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+
+Three suites:
+- estimator: throughput of `CVMEstimator.update_many` (update and prune path)
+  for several stream lengths and memory sizes; it does not need manim
+- setup: time of `cvm_algorithm(self, only_setup=True)` for several `n_stream_els`
+- render: time to render the first N iterations (`animate_first_n_els`)
+The scene suites use manim's low quality config, without writing any file.
+Every measure is the best of `--repeat` runs. Results are saved as JSON,
+together with the commit they were measured on.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from cvm_estimator import CVMEstimator
+
+ESTIMATOR_STREAM_LENS = [10**4, 10**5, 10**6]
+ESTIMATOR_MEMORY_SIZES = [100, 1000, 10000]
+SETUP_N_STREAM_ELS = [5, 10, 25, 50, 100, 1000, 10000]
+RENDER_N_ELS = [5, 10, 20]
+
+
+def best_time(fn, repeat: int) -> float:
+    "Best wall time of `repeat` calls of `fn`."
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_estimator(repeat: int) -> list:
+    results = []
+    for stream_len in ESTIMATOR_STREAM_LENS:
+        # about one distinct element every 4, so that both hits and inserts happen
+        rng = random.Random(stream_len)
+        stream = [rng.randrange(stream_len // 4) for _ in range(stream_len)]
+        for memory_size in ESTIMATOR_MEMORY_SIZES:
+            for batch_prune, fair_coins, skip_ahead in (
+                (False, False, False), (True, False, False), (True, True, False), (True, True, True)
+            ):
+                seconds = best_time(
+                    lambda: CVMEstimator(
+                        memory_size, seed=0, batch_prune=batch_prune, fair_coins=fair_coins, skip_ahead=skip_ahead
+                    ).update_many(stream),
+                    repeat,
+                )
+                results.append({
+                    'name': (
+                        f'estimator[len={stream_len},m={memory_size},'
+                        f'batch_prune={batch_prune},fair_coins={fair_coins},skip_ahead={skip_ahead}]'
+                    ),
+                    'seconds': seconds,
+                    'items_per_second': stream_len / seconds,
+                })
+    return results
+
+
+def _scene_config() -> dict:
+    "Low quality, no file written."
+    return {
+        'quality': 'low_quality',
+        'dry_run': True,
+        'disable_caching': True,
+        'progress_bar': 'none',
+        'verbosity': 'WARNING',
+    }
+
+
+def _time_scene(repeat: int, **cvm_kwargs) -> float:
+    from manim import Scene, tempconfig
+    from cvm import cvm_algorithm
+
+    class BenchScene(Scene):
+        def construct(self):
+            cvm_algorithm(self, **cvm_kwargs)
+
+    def render():
+        with tempconfig(_scene_config()):
+            BenchScene().render()
+
+    return best_time(render, repeat)
+
+
+def bench_setup(repeat: int) -> list:
+    return [
+        {
+            'name': f'setup[n_stream_els={n_stream_els}]',
+            'seconds': _time_scene(repeat, only_setup=True, n_stream_els=n_stream_els),
+        }
+        for n_stream_els in SETUP_N_STREAM_ELS
+    ]
+
+
+def bench_render(repeat: int) -> list:
+    return [
+        {
+            'name': f'render[animate_first_n_els={n_els}]',
+            'seconds': _time_scene(repeat, animate_first_n_els=n_els),
+        }
+        for n_els in RENDER_N_ELS
+    ]
+
+
+SUITES = {
+    'estimator': bench_estimator,
+    'setup': bench_setup,
+    'render': bench_render,
+}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path) -> None:
+    "Print the ratio after / before of the times of the benchmarks in both files."
+    with open(before_path) as f:
+        before = {r['name']: r['seconds'] for suite in json.load(f)['suites'].values() for r in suite}
+    with open(after_path) as f:
+        after = {r['name']: r['seconds'] for suite in json.load(f)['suites'].values() for r in suite}
+    for name in before:
+        if name in after:
+            print(f'{name:60} {before[name]:10.4f}s -> {after[name]:10.4f}s  x{after[name] / before[name]:.2f}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', choices=list(SUITES), action='append', help='suites to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'suites': {},
+    }
+    for suite in args.only or list(SUITES):
+        results['suites'][suite] = SUITES[suite](args.repeat)
+        for r in results['suites'][suite]:
+            print(f"{r['name']:60} {r['seconds']:10.4f}s")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
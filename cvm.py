@@ -1,15 +1,23 @@
 from manim import *
 from manim import config as mn_config
+import functools
+import inspect
+import os
 import random
 import string
+from collections import OrderedDict
 from typing import Optional, List
 
+from cvm_profiling import RenderProfiler
+from cvm_streams import iter_random_stream, random_stream
+from cvm_timeline import lttb, record_timeline
+from cvm_trace import HIT, Trace, decode_tosses, record_trace
+
 mn_config.media_width = "75%"
 mn_config.verbosity = "WARNING"
 
 
 STREAM_LEN = 50
-random.seed(STREAM_LEN)
 MEMORY_SIZE = 5
 
 # colors
@@ -27,6 +35,13 @@ RECAP_Z_INDEX = 5
 # constants for the sequence
 STREAM_ELS_WIDTH = .75
 STREAM_ELS_SPACING = .05
+STREAM_LETTERS_FONT_SIZE = 17
+STREAM_IXS_FONT_SIZE = 10
+# cells of the stream drawn at any time: the ones visible in the stream area
+# (the selected one and the ones on its right) plus a margin on both sides
+STREAM_VISIBLE_ELS = 8
+STREAM_WINDOW_MARGIN = 2
+STREAM_WINDOW_SIZE = STREAM_VISIBLE_ELS + 2 * STREAM_WINDOW_MARGIN
 STREAM_COIN_RADIUS = STREAM_ELS_WIDTH / 2 * .75
 STREAM_COIN_TEMPLATE = (
     Circle(radius=STREAM_COIN_RADIUS, color=COIN_COLOR, fill_opacity=1)
@@ -42,54 +57,61 @@ MEM_COIN_TEMPLATE = (
 )
 
 
-def build_ascii_seq(stream_len: int) -> str:
-    while True:
-        seq = ''.join([random.choice(string.ascii_uppercase) for _ in range(stream_len)])
-        if len(set(seq)) == len(set(string.ascii_uppercase)):
-            return seq
+# constants for the estimate-over-time plot
+TIMELINE_STREAM_LEN = 10**6
+TIMELINE_N_DISTINCT = 200_000
+TIMELINE_MEMORY_SIZE = 2000
+# points drawn per series, whatever the length of the stream
+TIMELINE_POINTS = 400
 
-STREAM = build_ascii_seq(STREAM_LEN)
 
-class RegularCoinSequenceTosser:
-    """
-    Create a non-random coin tosser that returns a sequence of k heads
-    at regular intervals. 
-    
-    If k = 1, then we generate 1H every 2**1 tosses.
-    If k = 2, then we generate 2H every 2**2 tosses.
-    ...
-    
-    The idea is that since it is only a simulation,
-    if the coin behaves as expected it helps understanding its implied probability.
-    """
+@functools.lru_cache(maxsize=None)
+def get_stream(stream_len: int = STREAM_LEN) -> str:
+    """The first `stream_len` letters of the stream (built on first use).
+    The first STREAM_LEN letters, where all the letters of the alphabet appear
+    at least once, are always the same; longer streams go on with random letters."""
+    stream = ''.join(random_stream(STREAM_LEN, string.ascii_uppercase, seed=STREAM_LEN))
+    if stream_len > STREAM_LEN:
+        stream += ''.join(random.Random(0).choices(string.ascii_uppercase, k=stream_len - STREAM_LEN))
+    return stream[:stream_len]
 
-    def __init__(self, k) -> None:
-        self.k = k
-        self._mod = 2**k
-        self._index = 0
-        self._g_index = 0
+# how many different formulas each Formula builder keeps in its cache
+FORMULA_CACHE_SIZE = 128
+# how many different (text, font size) glyphs are kept in the cache
+GLYPH_CACHE_SIZE = 256
+# how many rotated frames of the coin flips are kept in the cache
+FLIP_FRAMES_CACHE_SIZE = 1024
+# space between the digits of a number, relative to the font size
+DIGITS_SPACING = .002
 
-    def toss(self) -> int:
-        "Toss the coin one more time. Return 0 (tails) or 1 (heads)"
 
-        if self.k == 0:
-            return 1
+def copy_on_return_cache(maxsize: int = FORMULA_CACHE_SIZE):
+    """Memoize a mobject builder: the mobject is built (LaTeX compile + SVG parse)
+    only once per set of arguments and every call returns a copy of it,
+    so callers can move / recolor what they get without touching the cache.
+    The arguments are normalised first, so `f(1)` and `f(round_k=1)` share an entry.
+    The hit / miss counters are available via `builder.cache_info()`."""
 
-        self._index += 1
-        self._g_index = (self._index - 1) // self.k
-        
-        if (self._g_index + 1) % self._mod == 0:
-            return 1
-        
-        is_last_el = (self._index % self.k) == 0
-        if is_last_el:
-            return 0
-        
-        return random.choice([0,1])
+    def decorator(builder):
+        cached_builder = functools.lru_cache(maxsize=maxsize)(builder)
+        signature = inspect.signature(builder)
+
+        @functools.wraps(builder)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return cached_builder(*bound.args, **bound.kwargs).copy()
+
+        wrapper.cache_info = cached_builder.cache_info
+        wrapper.cache_clear = cached_builder.cache_clear
+        return wrapper
+
+    return decorator
 
 
 class Formula:
 
+    @copy_on_return_cache()
     def get_round_k_formula(round_k: int) -> MathTex:
         "Draw the formula for the round"
         f = MathTex(r'k = ', f'{round_k}')
@@ -98,6 +120,7 @@ class Formula:
         return f
 
 
+    @copy_on_return_cache()
     def get_p_formula(round_k: int) -> MathTex:
         """Draw the formula for the sampling probability"""
         f = MathTex(
@@ -128,6 +151,7 @@ class Formula:
         return f
 
 
+    @copy_on_return_cache()
     def get_chi_size_formula(memcount: int) -> MathTex:
         """Draw the formula for the memory count"""
         f = MathTex(r'|X|', '=', f'{memcount}')
@@ -136,6 +160,7 @@ class Formula:
         return f
 
 
+    @copy_on_return_cache()
     def get_memcount_over_p_formula(memsize, round_k):
         "Draw the formula for the unique elements estimated count."
         f = MathTex(
@@ -161,48 +186,112 @@ class Formula:
         return f
 
 
-def draw_stream(self: Scene, n_els=STREAM_LEN):
-    """Helper function that builds all the visual and auxiliary components 
-    related to the "stream" area of the animation.
+@copy_on_return_cache(maxsize=GLYPH_CACHE_SIZE)
+def get_glyph(text: str, font_size: float) -> Text:
+    """Draw a piece of text. The Pango layout is built only once
+    per (text, font size), the following calls get a copy of it."""
+    return Text(text, font_size=font_size)
+
+
+def get_number_glyph(number: int, font_size: float) -> VGroup:
+    """Draw a number by putting together the glyphs of its digits,
+    so that at most 10 layouts are built whatever the numbers."""
+    return (
+        VGroup(*[get_glyph(digit, font_size) for digit in str(number)])
+        .arrange(RIGHT, buff=DIGITS_SPACING * font_size, aligned_edge=DOWN)
+    )
+
+
+class StreamStrip:
     """
+    Windowed view of the stream: only the cells visible in the stream
+    surrounding rectangle (the selected one and the ones on its right),
+    plus a small margin on both sides, exist as mobjects.
 
-    stream_els_groups: List[VGroup] = []
-    stream_letters: List[Text] = []
-    
-    # for each element in the sequence, create some visual elements
-    for ith_stream_el, stream_el_str in enumerate(STREAM[:n_els]):
-        
+    Each time the stream shifts left by one cell, `advance` recycles the cells
+    that left the window on the left: their box is moved to the right end
+    and gets the letter and index of the next stream element.
+    So the cost of every step does not depend on the length of the stream.
+
+    `n_shifts` is the number of shifts already done, to start the strip
+    in the middle of the stream.
+    """
+
+    def __init__(self, stream: str, n_window_els: int = STREAM_WINDOW_SIZE, n_shifts: int = 0) -> None:
+        self.stream = stream
+        self.n_shifts = n_shifts
+        # stream position of the first (leftmost) cell of the window
+        self.first_pos = max(0, min(n_shifts - 1 - STREAM_WINDOW_MARGIN, len(stream) - n_window_els))
+        self.group = VGroup(*[
+            self._build_cell(pos)
+            for pos in range(self.first_pos, min(self.first_pos + n_window_els, len(stream)))
+        ])
+
+    def _build_labels(self, box: Square, pos: int) -> VGroup:
+        "Create the letter inside the box and the index above it."
+        return VGroup(
+            get_glyph(self.stream[pos], font_size=STREAM_LETTERS_FONT_SIZE)
+            .move_to(box.get_center()),
+            get_number_glyph(pos, font_size=STREAM_IXS_FONT_SIZE)
+            .next_to(box, UP, buff=.2),
+        )
+
+    def _build_cell(self, pos: int) -> VGroup:
         # create a box
-        a_stream_el_box = (
+        box = (
             Square(side_length=STREAM_ELS_WIDTH)
             .set_stroke(width=1)
         )
+        # create a vgroup (box + letter + index)
+        return VGroup(box, *self._build_labels(box, pos))
 
-        # create the letter inside
-        a_stream_letter = (
-            Text(stream_el_str, font_size=17)
-            .move_to(a_stream_el_box.get_center())
-        )
-        
-        # create the index above the box
-        a_stream_ix = (
-            Text(str(ith_stream_el), font_size=10)
-            .next_to(a_stream_el_box, UP, buff=.2)
-        )
+    def cell(self, pos: int) -> VGroup:
+        "The (box, letter, index) group of the stream element at `pos`."
+        return self.group[pos - self.first_pos]
+
+    def advance(self) -> None:
+        "To be called after each shift of the group to the left by one cell."
+        self.n_shifts += 1
+        # the element under the selector after this shift
+        selected_pos = self.n_shifts - 1
+
+        while (
+            self.first_pos < selected_pos - STREAM_WINDOW_MARGIN
+            and self.first_pos + len(self.group) < len(self.stream)
+        ):
+            new_pos = self.first_pos + len(self.group)
+            cell = self.group[0]
+            box, old_letter, old_ix = cell
+
+            # move the cell from the left end to the right end of the window
+            self.group.remove(cell)
+            cell.shift(RIGHT * (len(self.group) + 1) * (STREAM_ELS_WIDTH + STREAM_ELS_SPACING))
+
+            # swap its letter and index
+            cell.remove(old_letter, old_ix)
+            cell.add(*self._build_labels(box, new_pos))
+            cell.set_z_index(STREAM_Z_INDEX)
+
+            self.group.add(cell)
+            self.first_pos += 1
 
-        # create a vgroup (box + letter + index)
-        a_stream_el_group = VGroup(a_stream_el_box, a_stream_letter, a_stream_ix)
-        
-        # add the vgroup to the scene
-        self.add(a_stream_el_box, a_stream_letter, a_stream_ix)
 
-        # keep track of the elements
-        stream_letters.append(a_stream_letter)
-        stream_els_groups.append(a_stream_el_group)
+def draw_stream(self: Scene, n_els=STREAM_LEN, start_el=0, stream=None):
+    """Helper function that builds all the visual and auxiliary components 
+    related to the "stream" area of the animation.
+    Only a window of the stream is drawn, see `StreamStrip`.
+    The stream is drawn as it is right before the element `start_el` is selected.
+    stream: the letters of the stream, by default `get_stream(n_els)`.
+    """
+    if stream is None:
+        stream = get_stream(n_els)
+
+    # create the visual elements of the window
+    stream_strip = StreamStrip(stream[:n_els], n_shifts=start_el)
 
     # move / transform the group
     stream_group = (
-        VGroup(*stream_els_groups)
+        stream_strip.group
         .arrange(buff=STREAM_ELS_SPACING)
         .align_to(self.camera.frame_center, LEFT)
         .shift(1.85*UP + ORIGIN)
@@ -245,9 +334,15 @@ def draw_stream(self: Scene, n_els=STREAM_LEN):
         .next_to(stream_surr_rect, UP, aligned_edge=UL)
     )
 
+    # move the stream to the starting element
+    # (the window starts at `first_pos`, the stream was shifted `n_shifts` times)
+    stream_group.shift(
+        RIGHT * (stream_strip.first_pos - stream_strip.n_shifts) * (STREAM_ELS_WIDTH + STREAM_ELS_SPACING)
+    )
+
     self.add(stream_group, stream_selector_square, stream_surr_rect, stream_title)
 
-    return stream_group, stream_selector_square, stream_surr_rect, stream_title
+    return stream_strip, stream_selector_square, stream_surr_rect, stream_title
 
 
 
@@ -409,72 +504,84 @@ def draw_memory(self: Scene):
     )
 
 
-def sample_stream_element(
-    self: Scene, 
-    round_k: int, 
-    coin_tosser: RegularCoinSequenceTosser, 
-    stream_selector_square: Square,
-    run_time: float,
-):
-    """Implement the logic of tossing coins to determine whether an element
-    should be sampled into memory or not."""
-
-    # decide whether we should sample the current letter by tossing n coins
-    # the number of coins depends on the round
-    do_sample_current_letter = True
-    
-    pre_sampling_coins_group = (
-        VGroup()
-        .next_to(stream_selector_square, DOWN)
-        .align_to(stream_selector_square)
-    )
-    sampling_coins_group = None
+@copy_on_return_cache(maxsize=2)
+def get_coin_label(is_head: bool) -> MathTex:
+    "Draw the H / T label of a coin (built only once, then copied)."
+    return MathTex('H' if is_head else 'T')
 
-    # toss at most k coins
-    for ith_coin in range(round_k):
 
-        # create a coin and place it under the letter
-        letter_coin = STREAM_COIN_TEMPLATE.copy()
-        letter_coin_g = VGroup(letter_coin)
-
-        # update the group of coins so it has one more coin
-        sampling_coins_group = (
-            pre_sampling_coins_group
-            .copy()
-            .add(letter_coin_g)
-            .arrange(RIGHT, buff=-STREAM_COIN_RADIUS/2)
-        )
-        sampling_coins_group.next_to(stream_selector_square, DOWN)
+class CachedFlip(Animation):
+    """
+    Flip a coin about the horizontal axis, like `Rotate(coin, angle, axis=RIGHT)`.
+
+    The rotated points of every frame are computed only once for a given
+    coin shape, angle and (eased) time, and shared by all the flips:
+    every coin is a copy of the same template, so after the first flip
+    the others only translate cached points to their position.
+    The run times change every round, and so do the eased times: only the
+    FLIP_FRAMES_CACHE_SIZE most recently used frames are kept.
+    """
 
-        # animate the removal of the previous coins group
-        self.play(FadeOut(pre_sampling_coins_group), run_time=0.04)
-        self.remove(pre_sampling_coins_group)
-        
-        # add the new sampling group
-        self.add(sampling_coins_group)
-        letter_coin = sampling_coins_group[-1]
-        
-        # toss the coin
-        _is_head = coin_tosser.toss()
-        # determine the letter of the last coin
-        letter_coin_text = (
-            MathTex('H' if _is_head else 'T')
-            .move_to(letter_coin.get_center())
-        )
-        letter_coin_text.add_updater(
-            lambda o: o.move_to(letter_coin.get_center())
-        )
+    _frames_cache: 'OrderedDict[tuple, np.ndarray]' = OrderedDict()
+
+    def __init__(self, coin: VMobject, angle: float = PI * 15, **kwargs) -> None:
+        self.angle = angle
+        super().__init__(coin, **kwargs)
+
+    def begin(self) -> None:
+        self._center = self.mobject.get_center()
+        self._centered_points = self.mobject.points - self._center
+        self._shape_key = (self._centered_points.round(6).tobytes(), self.angle)
+        super().begin()
+
+    def interpolate_mobject(self, alpha: float) -> None:
+        t = round(self.rate_func(alpha), 4)
+        key = (self._shape_key, t)
+        frames_cache = self._frames_cache
+        rotated_points = frames_cache.get(key)
+        if rotated_points is None:
+            rotated_points = self._centered_points @ rotation_matrix(self.angle * t, RIGHT).T
+            frames_cache[key] = rotated_points
+            if len(frames_cache) > FLIP_FRAMES_CACHE_SIZE:
+                frames_cache.popitem(last=False)
+        else:
+            frames_cache.move_to_end(key)
+        self.mobject.points = rotated_points + self._center
+
+
+class CoinToss(VGroup):
+    """
+    A coin that can be tossed: it flips, then it turns green / red and shows H / T.
+    The label is part of the group (no updaters needed to keep it on the coin)
+    and `reset` prepares the coin to be tossed again.
+    """
 
-        # play the toss animation
-        self.play(
+    def __init__(self, template: Circle, flip_angle: float) -> None:
+        self.coin = template.copy()
+        self.label: Optional[MathTex] = None
+        self.flip_angle = flip_angle
+        super().__init__(self.coin)
+
+    def reset(self) -> 'CoinToss':
+        "Remove the result of the previous toss."
+        if self.label is not None:
+            self.remove(self.label)
+            self.label = None
+        self.coin.set_color(COIN_COLOR)
+        return self
+
+    def toss(self, scene: Scene, is_head: int, run_time: float) -> None:
+        "Play the toss of the coin, landing on `is_head`."
+        label = get_coin_label(is_head).move_to(self.coin.get_center())
+        scene.play(
             AnimationGroup(
-                # rotate
-                Rotate(letter_coin, angle=PI * 15, axis=RIGHT),
-                # change color
+                # flip the coin
+                CachedFlip(self.coin, angle=self.flip_angle),
+                # change the color based on head/tail
                 AnimationGroup(
-                    letter_coin.animate.set_color(GREEN if _is_head else RED),
+                    self.coin.animate.set_color(GREEN if is_head else RED),
                     # fade in H or T
-                    FadeIn(letter_coin_text),
+                    FadeIn(label),
 
                     lag_ratio=0
                 ),
@@ -483,20 +590,148 @@ def sample_stream_element(
                 lag_ratio=1
             )
         )
+        # FadeIn added the label to the scene on its own:
+        # make it part of the coin instead, so that it moves with it
+        scene.remove(label)
+        self.add(label)
+        self.label = label
+
+
+class CoinRow(VGroup):
+    """
+    Row of coins tossed one after the other, centered below `anchor`.
+    Coins are added to the row one by one, without rebuilding it.
+    """
 
-        # remember to add the coin letter to the group,
-        # so that it can move
-        letter_coin_g.add(letter_coin_text)
+    def __init__(self, template: Circle, anchor: Mobject, flip_angle: float) -> None:
+        self.template = template
+        self.anchor = anchor
+        self.flip_angle = flip_angle
+        super().__init__()
 
-        # update the sampling group
-        pre_sampling_coins_group = sampling_coins_group
+    def add_coin(self) -> CoinToss:
+        "Add a coin to the right end of the row (partially overlapping the previous one)."
+        coin = CoinToss(self.template, flip_angle=self.flip_angle)
+        if len(self) > 0:
+            coin.next_to(self[-1].coin, RIGHT, buff=-self.template.radius / 2)
+        self.add(coin)
+        self.next_to(self.anchor, DOWN)
+        return coin
 
-        # if the spin returns tail, stop tossing coins
-        if not _is_head:
-            break
-        # otherwise toss another one
-    
-    return do_sample_current_letter, sampling_coins_group, pre_sampling_coins_group
+
+# duration of a cleanup fade, whether played on its own or with another animation
+CLEANUP_RUN_TIME = 0.04
+
+
+def coalesce_cleanups_from_env() -> bool:
+    "Whether the CVM_COALESCE_CLEANUPS environment variable asks to coalesce the cleanups."
+    return os.environ.get('CVM_COALESCE_CLEANUPS', '').lower() in ('1', 'true', 'yes')
+
+
+class CleanupAnimations:
+    """
+    Short cleanup animations (fading out coins that are not needed anymore).
+
+    By default each cleanup is a tiny `play` of its own, as it has always been.
+    In coalescing mode, instead, `fade_out` queues the fade and `pop` hands
+    the queued fades over so they can be played together with the next
+    substantive animation, so that the render does not produce a partial
+    movie file per cleanup. The fades still last `CLEANUP_RUN_TIME`: they
+    run at the start of that animation and are over before it ends.
+    """
+
+    def __init__(self, scene: Scene, coalesce: bool = False) -> None:
+        self.scene = scene
+        self.coalesce = coalesce
+        self._pending: List[Mobject] = []
+
+    def _play_now(self, mobjects: List[Mobject]) -> None:
+        self.scene.play(*[FadeOut(m, run_time=CLEANUP_RUN_TIME) for m in mobjects])
+        self.scene.remove(*mobjects)
+
+    def fade_out(self, *mobjects: Mobject) -> None:
+        if self.coalesce:
+            self._pending.extend(m for m in mobjects if m not in self._pending)
+        else:
+            self._play_now(list(mobjects))
+
+    def pop(self, run_time: float) -> List[Animation]:
+        "The queued fades, to be passed to the next `play` call, lasting `run_time`."
+        # finish the fade within the first CLEANUP_RUN_TIME seconds of the animation
+        speedup = max(1., run_time / CLEANUP_RUN_TIME)
+        animations = [FadeOut(m, rate_func=lambda t: smooth(min(1., t * speedup))) for m in self._pending]
+        self._pending = []
+        return animations
+
+    def flush(self) -> None:
+        "Play the queued fades, if any, on their own."
+        if self._pending:
+            self._play_now(self._pending)
+            self._pending = []
+
+
+def draw_memory_contents(
+    self: Scene,
+    mem_letters: List[Optional[str]],
+    round_k: int,
+    mem_els_boxes: List[Square],
+    mem_els_pboxes: List[Rectangle],
+):
+    """Helper function that draws the letters already in memory,
+    with their sampling probability (the one of the current round).
+    Return the lists of the drawn letters and probabilities, by slot."""
+
+    # keep track of
+    # - the drawn letters (Text)
+    # - the drawn probabilities values (Text)
+    mem_els_letters: List[Optional[Text]]   = [None for _ in range(MEMORY_SIZE)]
+    mem_els_ps: List[Optional[Text]]        = [None for _ in range(MEMORY_SIZE)]
+
+    for ix, letter in enumerate(mem_letters):
+        if letter is None:
+            continue
+        mem_els_letters[ix] = (
+            get_glyph(letter, font_size=STREAM_LETTERS_FONT_SIZE)
+            .scale(2)
+            .set_color(MEMORY_COLOR)
+            .move_to(mem_els_boxes[ix].get_center())
+        )
+        mem_els_ps[ix] = (
+            Formula.get_p_formula(round_k)[1]
+            .scale(SMALL_P_SCALE_FACTOR)
+            .move_to(mem_els_pboxes[ix].get_center())
+        )
+        self.add(mem_els_letters[ix], mem_els_ps[ix])
+
+    return mem_els_letters, mem_els_ps
+
+
+def sample_stream_element(
+    self: Scene, 
+    tosses: List[int], 
+    stream_selector_square: Square,
+    run_time: float,
+):
+    """Animate the coins tossed to determine whether an element
+    should be sampled into memory or not.
+    The tosses themselves are decided by the estimator."""
+
+    # we should sample the current letter only if all the coins are heads
+    # the number of coins depends on the round
+    do_sample_current_letter = all(tosses)
+
+    # the coins go under the letter
+    # (at round 0 there is nothing to toss: the empty row stays out of the scene)
+    sampling_coins = CoinRow(STREAM_COIN_TEMPLATE, anchor=stream_selector_square, flip_angle=PI * 15)
+    if tosses:
+        self.add(sampling_coins)
+
+    # show at most k coins
+    # (the estimator stops tossing coins at the first tail)
+    for _is_head in tosses:
+        sampling_coins.add_coin().toss(self, _is_head, run_time=run_time)
+
+    return do_sample_current_letter, sampling_coins
     
 
 def cvm_algorithm(
@@ -504,40 +739,56 @@ def cvm_algorithm(
     only_setup=False, 
     n_stream_els=None, 
     animate_first_n_els=None, 
-    seed=0
+    seed=0,
+    trace: Optional[Trace] = None,
+    coalesce_cleanups=False,
+    start_el=0,
+    final_wait=True,
+    profile_path=None,
+    stream=None,
 ):
     """
     Main function.
     only_setup: whether only the setup should be drawn, without the algorithm animation.
-    n_stream_els: how many elements of the stream should be included in the animation. max 100.
+    n_stream_els: how many elements of the stream should be included in the animation.
     animate_first_n_els: how many iterations should be animated
     seed: seed for random events
+    trace: a recorded run of the algorithm over the stream to replay (e.g. `Trace.load(path)`).
+        If None, the run is recorded on the fly with `seed`.
+    coalesce_cleanups: whether the short cleanup fades should be merged into the
+        neighbouring animations instead of being played on their own (see `CleanupAnimations`).
+    start_el: the first element to animate; the scene starts from the state
+        (memory, recap, stream position) the recorded run had right before it.
+    final_wait: whether to wait at the end of the animation.
+    profile_path: if given, measure time, play calls, frames, mobjects and memory
+        of each phase of the render and write a JSON report there (see `RenderProfiler`).
+    stream: the letters of the stream, by default `get_stream(n_stream_els)`.
     """
 
-    random.seed(seed)
-
     if n_stream_els is None:
         n_stream_els = STREAM_LEN
     if animate_first_n_els is None:
         animate_first_n_els = n_stream_els
-    n_stream_els = min(100, n_stream_els)
+    if stream is None:
+        stream = get_stream(n_stream_els)
+    n_stream_els = min(len(stream), n_stream_els)
     animate_first_n_els = min(n_stream_els, animate_first_n_els)
 
-    # start with probability 1, round 0
-    p = 1
-    round_k = 0
+    # the algorithm is simulated once and the animation replays its events:
+    # coin tosses, the memory slot of each letter, pruning, round changes
+    if trace is None:
+        trace = record_trace(stream[:animate_first_n_els], MEMORY_SIZE, seed=seed)
+    else:
+        # the events only hold positions, make sure they are about this stream
+        trace.validate(stream, MEMORY_SIZE)
 
-    # instantiate random events generators
-    k_coin_tosser = RegularCoinSequenceTosser(k=round_k)    # for the stream
-    one_coin_pgen = RegularCoinSequenceTosser(k=1)          # for clearing the memory (fixed p=1/2)
+    # start from the state of the run right before `start_el`
+    # (probability 1, round 0 and empty memory if starting from the beginning)
+    start_slots, round_k = trace.state_at(start_el)
+    n_mem_els = sum(slot is not None for slot in start_slots)
 
-    # instantiate the memory; keep track of
-    # - the raw letters (str)
-    # - the drawn letters (Text)
-    # - the drawn probabilities values (Text)
-    mem_list: List[Optional[str]]           = [None for _ in range(MEMORY_SIZE)]
-    mem_els_letters: List[Optional[Text]]   = [None for _ in range(MEMORY_SIZE)]
-    mem_els_ps: List[Optional[Text]]        = [None for _ in range(MEMORY_SIZE)]
+    profiler = RenderProfiler(self, frame_rate=mn_config.frame_rate, enabled=profile_path is not None)
+    profiler.round_k = round_k
 
     ## DRAW TITLE ############################################################## DRAW TITLE
     scene_title = (
@@ -548,22 +799,34 @@ def cvm_algorithm(
     self.add(scene_title)
 
     ## DRAW THE MEMORY ######################################################### DRAW THE MEMORY
+    profiler.start('draw_memory')
     (
         _,
         mem_els_groups,
         mem_els_boxes,
         mem_els_pboxes,
     ) = draw_memory(self)
+    mem_els_letters, mem_els_ps = draw_memory_contents(
+        self,
+        mem_letters=[None if slot is None else stream[slot] for slot in start_slots],
+        round_k=round_k,
+        mem_els_boxes=mem_els_boxes,
+        mem_els_pboxes=mem_els_pboxes,
+    )
+    profiler.stop()
 
     ## DRAW THE SEQUENCE ####################################################### DRAW THE SEQUENCE
+    profiler.start('draw_stream')
     (
-        stream_group, 
+        stream_strip, 
         stream_selector_square, 
         _, 
         _
-    ) = draw_stream(self, n_els=n_stream_els)
+    ) = draw_stream(self, n_els=n_stream_els, start_el=start_el, stream=stream)
+    profiler.stop()
 
     ## DRAW THE RECAP ########################################################## DRAW THE RECAP
+    profiler.start('draw_recap_section')
     (
         recap_g, 
         _,
@@ -574,75 +837,89 @@ def cvm_algorithm(
     ) = draw_recap_section(
         self,
         round_k=round_k, 
-        n_mem_els=MEMORY_SIZE - mem_list.count(None),
+        n_mem_els=n_mem_els,
         scene_title=scene_title
     )
+    profiler.stop()
 
     # terminate if only the setup is requested
     if only_setup:
+        if profile_path is not None:
+            profiler.save(profile_path)
         return
 
+    cleanup = CleanupAnimations(self, coalesce=coalesce_cleanups)
+
     ## MAIN ALGORITHM ########################################################## MAIN ALGORITHM
 
-    for letter, stream_el_group in zip(STREAM[:animate_first_n_els], stream_group):
+    for pos, step_events in trace.steps(start=start_el, stop=animate_first_n_els):
+
+        kind, _, event_arg = next(step_events)
+        profiler.round_k = round_k
 
         # set the run times
         _run_time = max(1 * (.8 ** round_k), 0.04)
         _run_time_fast = max(_run_time * .8, 0.04)
         
         # shift the stream to the left
+        profiler.start('shift_stream')
         self.play( 
-            stream_group.animate.shift(LEFT * (STREAM_ELS_WIDTH + STREAM_ELS_SPACING)),
+            stream_strip.group.animate.shift(LEFT * (STREAM_ELS_WIDTH + STREAM_ELS_SPACING)),
+            # and fade out what is left of the previous element, if coalescing
+            *cleanup.pop(_run_time_fast),
 
             run_time=_run_time_fast
         )
+        # recycle the cells that left the window
+        stream_strip.advance()
+        profiler.stop()
         
+        stream_el_group = stream_strip.cell(pos)
         _stream_el_box, stream_el_letter, _stream_el_index = stream_el_group
         src_stream_letter: Text = stream_el_letter.copy()
 
         # if the current letter is already in the memory list,
         # remove it
-        if letter in mem_list:
-            to_pop_ix = mem_list.index(letter)
+        if kind == HIT:
+            to_pop_ix = event_arg
+            profiler.start('hit')
             self.play(
                 Indicate(mem_els_letters[to_pop_ix], color=WHITE, scale_factor=1.75),
                 Indicate(stream_el_letter, color=WHITE, scale_factor=1.75),
 
                 run_time=_run_time_fast
             )
+            profiler.stop()
             continue
         
         # if the letter is not in the memory
         # decide whether to sample it
-        do_sample, sampling_coins_group, pre_sampling_coins_group = sample_stream_element(
+        profiler.start('sample_stream_element')
+        do_sample, sampling_coins = sample_stream_element(
             self,
-            round_k=round_k,
-            coin_tosser=k_coin_tosser,
+            tosses=decode_tosses(event_arg),
             stream_selector_square=stream_selector_square,
-            run_time=_run_time_fast
+            run_time=_run_time_fast,
         )
+        profiler.stop()
         # if not sampling, fade out the sampling coins, 
         # move to the next element in the stream
         if not do_sample:
             # if it wasn't a win, go to the next letter
-            self.play(
-                FadeOut(sampling_coins_group, run_time=0.04), 
-                FadeOut(pre_sampling_coins_group, run_time=0.04),
-                
-            )
-            self.remove(sampling_coins_group)
-            self.remove(pre_sampling_coins_group)
+            with profiler.phase('cleanup'):
+                cleanup.fade_out(sampling_coins)
             continue
         # otherwise, place the element in the memory
         
         # find the box where it must go
-        next_empty_box_ix = mem_list.index(None)
+        profiler.start('insert')
+        _, _, next_empty_box_ix = next(step_events)
         dest_mem_box: Square = mem_els_boxes[next_empty_box_ix]
         dest_mem_pbox: Rectangle = mem_els_pboxes[next_empty_box_ix]
 
         # move the letter to the memory box
         dest_mem_letter = (
-            src_stream_letter.copy()
+            get_glyph(stream[pos], font_size=STREAM_LETTERS_FONT_SIZE)
             .scale(2)
             .set_color(MEMORY_COLOR)
             .move_to(dest_mem_box.get_center())
@@ -652,11 +929,8 @@ def cvm_algorithm(
             .scale(SMALL_P_SCALE_FACTOR)
             .move_to(dest_mem_pbox.get_center())
         )
-        # place the letter in the memory list
-        mem_list[next_empty_box_ix] = letter
-        
         # update the recap formulas
-        n_mem_els = MEMORY_SIZE - mem_list.count(None)
+        n_mem_els += 1
         new_recap_chi_size = (
             Formula.get_chi_size_formula(n_mem_els)
             .move_to(recap_chi_size.get_center())
@@ -690,29 +964,27 @@ def cvm_algorithm(
         
         # remove the sampling coins at the end of each iteration
         if round_k > 0:
-            self.play(
-                FadeOut(pre_sampling_coins_group, run_time=0.04), 
-                FadeOut(sampling_coins_group, run_time=0.04),
-            )
-            self.remove(pre_sampling_coins_group)
-            self.remove(sampling_coins_group)
+            cleanup.fade_out(sampling_coins)
+        profiler.stop()
         
-        # if there is still room in the memory (at least a None), continue with the next letter 
-        if mem_list.count(None) > 0:
+        # if there is still room in the memory (no pruning events), continue with the next letter 
+        prune_events = list(step_events)
+        if not prune_events:
             continue
+        *prune_passes, (_, _, new_round_k) = prune_events
 
         # otherwise memory is full!
         # full memory == next round
 
         # prune the memory
-        removed_any = False
         # the original algorithm fails if no elements are removed
-        # here include a while that ensures at least one element is removed
-        while not removed_any:
+        # so the simulation repeats the pass until at least one element is removed
+        profiler.start('pruning')
+        for _, _, prune_flips in prune_passes:
             
             # instantiate a coin
             mem_pruning_coin = (
-                MEM_COIN_TEMPLATE.copy()
+                CoinToss(MEM_COIN_TEMPLATE, flip_angle=PI * 10)
                 .next_to(mem_els_groups[-1], DOWN, buff=.3)
             )
 
@@ -721,55 +993,31 @@ def cvm_algorithm(
             current_chisize_over_p = recap_chisize_over_p.copy()
             self.play(
                 recap_chisize_over_p.animate.set_color(GREY),
+                *cleanup.pop(_run_time_fast),
                 
                 run_time=_run_time_fast
             )
 
             # visit all the elements of the memory 
             # (backwards, because I prefer visually...)
-            mem_pruning_coin_text = None
-            for ith_ml, ml in enumerate(mem_list[::-1], 1):
+            self.add(mem_pruning_coin)
+            for ith_ml, (to_pop_ix, is_toss_head) in enumerate(
+                zip(reversed(range(MEMORY_SIZE)), decode_tosses(prune_flips)), 1
+            ):
                 
                 if ith_ml > 1:
                     # shift the coin under the next element in the memory
-                    # and update the color
-                    self.remove(mem_pruning_coin_text)
-                    mem_pruning_coin.next_to(mem_els_groups[-ith_ml], DOWN, buff=.3)
-                    mem_pruning_coin.set_color(COIN_COLOR)
-
-                # toss the coin and determine the letter
-                is_toss_head = one_coin_pgen.toss()
-                mem_pruning_coin_text = (
-                    MathTex('H' if is_toss_head else 'T')
-                    .move_to(mem_pruning_coin.get_center())
-                )
+                    # and clear the previous toss
+                    mem_pruning_coin.reset().next_to(mem_els_groups[-ith_ml], DOWN, buff=.3)
 
                 # animate the rotation and the color change
-                self.play(AnimationGroup(
-                    # flip the coin
-                    Rotate(mem_pruning_coin, angle=PI * 10, axis=RIGHT),
-                    # change the color based on head/tail
-                    AnimationGroup(
-                        mem_pruning_coin.animate.set_color(GREEN if is_toss_head else RED),
-                        FadeIn(mem_pruning_coin_text),
-                        
-                        lag_ratio=0
-                    ),
-
-                    run_time=_run_time_fast,
-                    lag_ratio=1
-                ))
+                mem_pruning_coin.toss(self, is_toss_head, run_time=_run_time_fast)
                 
                 # if tail remove the letter from the memory
                 if not is_toss_head:
 
-                    # find the index of the element to remove
-                    to_pop_ix = mem_list.index(ml)
-                    # remove the letter from the memory list
-                    mem_list[to_pop_ix] = None
-
                     # update the memory size formula
-                    n_mem_els = MEMORY_SIZE - mem_list.count(None)
+                    n_mem_els -= 1
                     new_recap_chi_size = (
                         Formula.get_chi_size_formula(n_mem_els)
                         .move_to(recap_chi_size.get_center())
@@ -779,8 +1027,8 @@ def cvm_algorithm(
                     # play the animation
                     self.play(
                         # play the fadeout of the letter and its prob
-                        FadeOut(mem_els_letters[to_pop_ix], shift=UP, run_time=0.04),
-                        FadeOut(mem_els_ps[to_pop_ix], shift=UP, run_time=0.04),
+                        FadeOut(mem_els_letters[to_pop_ix], shift=UP, run_time=CLEANUP_RUN_TIME),
+                        FadeOut(mem_els_ps[to_pop_ix], shift=UP, run_time=CLEANUP_RUN_TIME),
                         # update the memory size
                         ReplacementTransform(recap_chi_size[-1], new_recap_chi_size[-1]),
 
@@ -796,9 +1044,6 @@ def cvm_algorithm(
                     )
                     mem_els_letters[to_pop_ix] = None
                     mem_els_ps[to_pop_ix] = None
-                    
-                    # record that at least one element was removed from the memory
-                    removed_any = True
 
                 # if it's heads, half the current prob
                 else:
@@ -807,7 +1052,7 @@ def cvm_algorithm(
                     current_p = mem_els_ps[-ith_ml]
                     # the new is the same as the p of the formula in the next round
                     new_p = (
-                        Formula.get_p_formula(round_k=round_k+1)
+                        Formula.get_p_formula(round_k + 1)
                         [1]
                         .scale(SMALL_P_SCALE_FACTOR)
                         .set_color(GREY)
@@ -832,7 +1077,7 @@ def cvm_algorithm(
                                 # create the 1/2
                                 Create(n1_2, lag_ratio=0),
                                 # move it to the probability box
-                                AnimationGroup(MoveToTarget(n1_2), FadeOut(n1_2, run_time=0.04), lag_ratio=.9),
+                                AnimationGroup(MoveToTarget(n1_2), FadeOut(n1_2, run_time=CLEANUP_RUN_TIME), lag_ratio=.9),
                                 lag_ratio=0,
                                 
                                 run_time=_run_time_fast
@@ -847,7 +1092,7 @@ def cvm_algorithm(
                     )
 
             # remove the memory coin after the memory is pruned
-            self.remove(mem_pruning_coin, mem_pruning_coin_text)
+            self.remove(mem_pruning_coin)
 
             # recolor chi over p
             self.play(
@@ -857,9 +1102,9 @@ def cvm_algorithm(
 
         # after pruning the memory
         # update the round number, the probability and all the recap
-        round_k += 1
-        p = p / 2
-        k_coin_tosser = RegularCoinSequenceTosser(k=round_k)
+        profiler.stop()
+        round_k = new_round_k
+        profiler.start('recap_update')
         
         new_recap_round_k = (
             Formula.get_round_k_formula(round_k)
@@ -896,13 +1141,145 @@ def cvm_algorithm(
         recap_round_k = new_recap_round_k
         recap_p = new_recap_p
         recap_chisize_over_p = new_recap_chisize_over_p
+        profiler.stop()
         
-    self.wait()
+    with profiler.phase('cleanup'):
+        cleanup.flush()
+    if final_wait:
+        self.wait()
+
+    if profile_path is not None:
+        profiler.save(profile_path)
     
 
+def draft_keyframes(
+    self: Scene,
+    output_dir,
+    n_stream_els=None,
+    seed=0,
+    trace: Optional[Trace] = None,
+    stream=None,
+) -> List[str]:
+    """
+    Draft mode: run the algorithm headless and save one still per round,
+    showing the scene (memory contents, p values, recap, stream position) as
+    it is right at the start of the round (or at the end of the stream, for a
+    round reached on the last element). Nothing is animated: every still
+    is the setup drawn by `cvm_algorithm(self, only_setup=True, start_el=...)`.
+    Return the paths of the images.
+    """
+    if n_stream_els is None:
+        n_stream_els = STREAM_LEN
+    if stream is None:
+        stream = get_stream(n_stream_els)
+    n_stream_els = min(len(stream), n_stream_els)
+    if trace is None:
+        trace = record_trace(stream[:n_stream_els], MEMORY_SIZE, seed=seed)
+
+    start_els = [start_el for start_el, _ in trace.round_segments()]
+    # no segment starts after a round change on the last element:
+    # that round is only drawn as the final state, with the stream at its end
+    if trace.state_at(trace.n_stream_els)[1] != trace.state_at(start_els[-1])[1]:
+        start_els.append(trace.n_stream_els)
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for start_el in start_els:
+        self.clear()
+        cvm_algorithm(
+            self, only_setup=True, n_stream_els=n_stream_els, trace=trace, start_el=start_el, stream=stream
+        )
+        _, round_k = trace.state_at(start_el)
+
+        self.renderer.update_frame(self)
+        path = os.path.join(output_dir, f'CVM_round_{round_k:02d}.png')
+        self.renderer.camera.get_image().save(path)
+        paths.append(path)
+    return paths
+
+
+def estimate_timeline(
+    self: Scene,
+    n_stream_els=TIMELINE_STREAM_LEN,
+    n_distinct=TIMELINE_N_DISTINCT,
+    memory_size=TIMELINE_MEMORY_SIZE,
+    n_points=TIMELINE_POINTS,
+    seed=0,
+):
+    """
+    Run the algorithm headless over a long random stream (`n_stream_els` elements,
+    `n_distinct` distinct ones) and plot the estimate |X|/p against the true number
+    of distinct elements seen so far, with a marker where the round changes.
+    Both series are downsampled to `n_points` points (see `cvm_timeline.lttb`),
+    so the cost of the animation does not depend on the length of the stream.
+    """
+    stream = iter_random_stream(n_stream_els, range(2**62), n_distinct, seed=seed)
+    timeline = record_timeline(stream, n_stream_els, memory_size, seed=seed)
+
+    scene_title = Tex(r"\underline{\textbf{CVM Algorithm}}").to_edge(UL)
+    y_max = max(timeline.estimates.max(), timeline.true_counts.max())
+    axes = Axes(
+        x_range=[0, n_stream_els, n_stream_els // 5],
+        y_range=[0, y_max * 1.1, max(1, int(y_max * 1.1) // 5)],
+        x_length=11,
+        y_length=5.5,
+        tips=False,
+        axis_config={'include_numbers': True, 'font_size': 20},
+    ).to_edge(DOWN)
+    axes_labels = axes.get_axis_labels(
+        Tex('Stream elements', font_size=25), Tex('Unique values', font_size=25)
+    )
+
+    def downsampled_graph(series, color):
+        ixs = lttb(series, n_points)
+        return axes.plot_line_graph(
+            x_values=ixs, y_values=series[ixs], add_vertex_dots=False, line_color=color, stroke_width=3
+        )
+
+    true_graph = downsampled_graph(timeline.true_counts, MEMORY_COLOR)
+    estimate_graph = downsampled_graph(timeline.estimates, P_COLOR)
+    round_markers = VGroup(*[
+        Dot(axes.c2p(pos, timeline.estimates[pos]), radius=.05, color=ROUND_COLOR)
+        for pos in timeline.round_changes
+    ])
+
+    legend = VGroup(
+        *[
+            VGroup(Line(ORIGIN, .4 * RIGHT, color=color, stroke_width=3), Tex(label, font_size=25)).arrange(RIGHT)
+            for color, label in ((P_COLOR, r'Estimate $|X|/p$'), (MEMORY_COLOR, 'True count'))
+        ],
+        VGroup(Dot(radius=.05, color=ROUND_COLOR), Tex('Round change', font_size=25)).arrange(RIGHT),
+    ).arrange(DOWN, aligned_edge=LEFT).to_edge(UR)
+
+    self.add(scene_title)
+    self.play(Create(axes), Write(axes_labels), FadeIn(legend))
+    self.play(Create(true_graph), Create(estimate_graph), run_time=4, rate_func=linear)
+    if len(round_markers):
+        self.play(LaggedStartMap(FadeIn, round_markers, lag_ratio=.2))
+    self.wait()
+
+
 class CVM(Scene):
     def construct(self):
-        cvm_algorithm(self)
+        # set CVM_PROFILE to a path to get a report of where the render spends time
+        # and CVM_COALESCE_CLEANUPS=1 to merge the cleanup fades into the next animations
+        cvm_algorithm(
+            self,
+            profile_path=os.environ.get('CVM_PROFILE'),
+            coalesce_cleanups=coalesce_cleanups_from_env(),
+        )
+
+
+class CVMTimeline(Scene):
+    "Estimate over time on a long stream: `manim cvm.py CVMTimeline`"
+    def construct(self):
+        estimate_timeline(self)
+
+
+class CVMDraft(Scene):
+    "One still per round, in <media_dir>/images/cvm_draft: `manim cvm.py CVMDraft`"
+    def construct(self):
+        draft_keyframes(self, os.path.join(mn_config.media_dir, 'images', 'cvm_draft'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,177 @@
+"""Monte Carlo accuracy harness of the CVM estimate.
+
+Thousands of independent runs of the algorithm over the same stream are
+simulated at once: the state of all the trials is held in NumPy arrays
+(one row per trial) and the coins of all the trials are drawn in batches,
+so the Python loop runs once per stream element, not once per trial.
+
+Two variants of the update can be simulated:
+- 'scene': an element already in memory is left there (as in the animation
+  and in `CVMEstimator`)
+- 'paper': an element already in memory is removed and sampled again with
+  the current p, as in the paper
+In both variants coins are fair and, as in the animation, a pruning pass
+that removes nothing is repeated.
+
+The state is one bool per (trial, distinct element), so it grows with the
+number of distinct elements, not with the memory size: the trials are run
+in batches of at most MAX_STATE_SIZE bools (50 MB), and with millions of
+distinct elements a batch holds only a few trials (and the Python loop then
+runs once per element per batch). The pruning coins are only drawn for the
+elements in memory.
+
+    python cvm_accuracy.py --trials 10000 --memory-sizes 5 10 20 --stream-lens 50 500
+"""
+import argparse
+import json
+from typing import Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+VARIANTS = ('scene', 'paper')
+QUANTILES = (.05, .25, .5, .75, .95)
+# upper bound to the size of the trials x distinct elements state, per batch of trials
+MAX_STATE_SIZE = 50_000_000
+# how many stream elements get their coins drawn at once
+COINS_BATCH_SIZE = 1024
+
+
+def _simulate_batch(
+    stream_ids: np.ndarray,
+    n_distinct: int,
+    memory_size: int,
+    n_trials: int,
+    rng: np.random.Generator,
+    variant: str,
+) -> np.ndarray:
+    "Estimates |X|/p of `n_trials` independent runs over the stream."
+    in_memory = np.zeros((n_trials, n_distinct), dtype=bool)
+    counts = np.zeros(n_trials, dtype=np.int64)
+    rounds = np.zeros(n_trials, dtype=np.int64)
+
+    for batch_start in range(0, len(stream_ids), COINS_BATCH_SIZE):
+        batch = stream_ids[batch_start:batch_start + COINS_BATCH_SIZE]
+        # one uniform per (element, trial): the element is sampled if it is below p
+        coins = rng.random((len(batch), n_trials))
+
+        for item, item_coins in zip(batch, coins):
+            present = in_memory[:, item]
+            if variant == 'paper':
+                # remove the element, it will be sampled again
+                counts -= present
+                in_memory[:, item] = False
+                present = np.zeros(n_trials, dtype=bool)
+            sampled = ~present & (item_coins < np.ldexp(1., -rounds))
+            in_memory[:, item] |= sampled
+            counts += sampled
+
+            full = np.flatnonzero(counts == memory_size)
+            while len(full):
+                # fair coin for every element of the full memories
+                rows, cols = np.nonzero(in_memory[full])
+                heads = rng.random(len(rows)) < .5
+                kept = np.zeros((len(full), n_distinct), dtype=bool)
+                kept[rows[heads], cols[heads]] = True
+                n_kept = np.bincount(rows[heads], minlength=len(full))
+                # repeat the pass where nothing was removed
+                removed_any = n_kept < memory_size
+                done = full[removed_any]
+                in_memory[done] = kept[removed_any]
+                counts[done] = n_kept[removed_any]
+                rounds[done] += 1
+                full = full[~removed_any]
+
+    return counts * np.ldexp(1., rounds)
+
+
+def run_trials(
+    stream: Sequence[Hashable],
+    memory_size: int,
+    n_trials: int = 10_000,
+    seed: Optional[int] = None,
+    variant: str = 'scene',
+) -> np.ndarray:
+    "Return the estimates of `n_trials` independent runs over `stream`."
+    if variant not in VARIANTS:
+        raise ValueError(f'Unknown variant {variant!r}, expected one of {VARIANTS}')
+
+    # map the elements to 0..n_distinct-1
+    _, stream_ids = np.unique(np.asarray(stream), return_inverse=True)
+    n_distinct = int(stream_ids.max()) + 1 if len(stream_ids) else 0
+    rng = np.random.default_rng(seed)
+
+    trials_per_batch = max(1, MAX_STATE_SIZE // max(1, n_distinct))
+    return np.concatenate([
+        _simulate_batch(stream_ids, n_distinct, memory_size, min(trials_per_batch, n_trials - start), rng, variant)
+        for start in range(0, n_trials, trials_per_batch)
+    ])
+
+
+def summarize(estimates: np.ndarray, true_count: int) -> Dict[str, float]:
+    "Bias, variance and quantiles of the estimates and of their relative error."
+    rel_errors = np.abs(estimates - true_count) / true_count
+    summary = {
+        'true_count': true_count,
+        'mean': float(estimates.mean()),
+        'bias': float(estimates.mean() - true_count),
+        'relative_bias': float(estimates.mean() / true_count - 1),
+        'variance': float(estimates.var()),
+        'std': float(estimates.std()),
+    }
+    for q, estimate_q, rel_error_q in zip(
+        QUANTILES, np.quantile(estimates, QUANTILES), np.quantile(rel_errors, QUANTILES)
+    ):
+        summary[f'q{q * 100:g}'] = float(estimate_q)
+        summary[f'relative_error_q{q * 100:g}'] = float(rel_error_q)
+    return summary
+
+
+def sweep(
+    stream: Sequence[Hashable],
+    memory_sizes: Sequence[int],
+    stream_lens: Sequence[int],
+    n_trials: int = 10_000,
+    seed: Optional[int] = None,
+    variant: str = 'scene',
+) -> List[dict]:
+    "Summaries of the estimates for every memory size and stream prefix length."
+    results = []
+    for stream_len in stream_lens:
+        prefix = stream[:stream_len]
+        true_count = len(set(prefix))
+        for memory_size in memory_sizes:
+            estimates = run_trials(prefix, memory_size, n_trials=n_trials, seed=seed, variant=variant)
+            results.append({
+                'memory_size': memory_size,
+                'stream_len': len(prefix),
+                'n_trials': n_trials,
+                'variant': variant,
+                **summarize(estimates, true_count),
+            })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trials', type=int, default=10_000)
+    parser.add_argument('--memory-sizes', type=int, nargs='+', default=[5, 10, 20])
+    parser.add_argument('--stream-lens', type=int, nargs='+', default=[50])
+    parser.add_argument('--n-distinct', type=int, default=26)
+    parser.add_argument('--variant', choices=VARIANTS, default='scene')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='where to save the results as JSON')
+    args = parser.parse_args()
+
+    stream_rng = np.random.default_rng(args.seed)
+    stream = stream_rng.integers(args.n_distinct, size=max(args.stream_lens)).tolist()
+    results = sweep(stream, args.memory_sizes, args.stream_lens, args.trials, args.seed, args.variant)
+
+    for r in results:
+        print(
+            f"len={r['stream_len']:<8} m={r['memory_size']:<6} true={r['true_count']:<8} "
+            f"mean={r['mean']:<10.1f} rel.bias={r['relative_bias']:+.3f} std={r['std']:<10.1f} "
+            f"rel.err q50={r['relative_error_q50']:.3f} q95={r['relative_error_q95']:.3f}"
+        )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
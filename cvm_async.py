@@ -0,0 +1,109 @@
+"""Asyncio front end of the estimator, for live streams.
+
+`AsyncCVMEstimator.consume(source)` feeds the estimator from an async
+iterable (e.g. the lines of a socket) and `consume_queue(queue)` from an
+`asyncio.Queue`. The elements are applied in batches of what is already
+available, so there is no extra latency when the stream is slow and little
+per-element overhead when it is fast. Between two batches the event loop
+runs the other tasks, which can read `estimate()`, `round_k` and `p` at any
+moment: the estimator is only touched by the batch being applied, so they
+always see the state at the end of a batch.
+
+Backpressure comes from bounded queues: when the estimator falls behind,
+`queue.put` blocks the producer (or the reader of the async iterable).
+
+    async def count_clients(reader: asyncio.StreamReader, estimator: AsyncCVMEstimator):
+        await estimator.consume(reader)  # one element per line
+"""
+import asyncio
+from typing import AsyncIterable, Dict, Hashable
+
+from cvm_estimator import CVMEstimator
+
+# put it in a queue to tell the consumer the stream is over
+END_OF_STREAM = object()
+
+# at most this many elements are applied before yielding to the other tasks
+BATCH_SIZE = 4096
+# at most this many elements wait to be applied when reading an async iterable
+MAX_PENDING = 4 * BATCH_SIZE
+
+
+class AsyncCVMEstimator:
+    """A `CVMEstimator` (built with `estimator_kwargs`) fed by a coroutine,
+    whose state can be queried while it is being fed.
+
+    By default the estimator uses fair coins and the update of the paper, so
+    that the estimate is unbiased (the coins of the animation are not meant
+    for live counts); `estimator_kwargs` can override them."""
+
+    def __init__(
+        self, memory_size: int, batch_size: int = BATCH_SIZE, max_pending: int = MAX_PENDING, **estimator_kwargs
+    ) -> None:
+        estimator_kwargs = {'fair_coins': True, 'resample_repeats': True, **estimator_kwargs}
+        self.estimator = CVMEstimator(memory_size, **estimator_kwargs)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+
+    @property
+    def round_k(self) -> int:
+        return self.estimator.round_k
+
+    @property
+    def p(self) -> float:
+        return self.estimator.p
+
+    @property
+    def n_seen(self) -> int:
+        return self.estimator.n_seen
+
+    def estimate(self) -> int:
+        return self.estimator.estimate()
+
+    def snapshot(self) -> Dict[str, float]:
+        "The current estimate, round, p and number of elements seen, all from the same batch."
+        return {
+            'estimate': self.estimate(),
+            'round_k': self.round_k,
+            'p': self.p,
+            'n_seen': self.n_seen,
+        }
+
+    async def consume_queue(self, queue: asyncio.Queue) -> None:
+        "Apply the elements put in `queue` until `END_OF_STREAM` is found."
+        while True:
+            # wait for one element, then take all those that are already there
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            ended = batch[-1] is END_OF_STREAM
+            if ended:
+                batch.pop()
+
+            self.estimator.update_many(batch)
+            for _ in range(len(batch) + ended):
+                queue.task_done()
+            if ended:
+                return
+            # let the other tasks run (and read the state) between batches
+            await asyncio.sleep(0)
+
+    async def consume(self, source: AsyncIterable[Hashable]) -> None:
+        "Apply all the elements of an async iterable."
+        queue = asyncio.Queue(self.max_pending)
+
+        async def read():
+            try:
+                async for item in source:
+                    await queue.put(item)
+            finally:
+                await queue.put(END_OF_STREAM)
+
+        reader = asyncio.create_task(read())
+        try:
+            await self.consume_queue(queue)
+        finally:
+            if not reader.done():
+                reader.cancel()
+        # raise the errors of the source, if any
+        await reader
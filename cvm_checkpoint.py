@@ -0,0 +1,182 @@
+"""Compact binary checkpoints of a `CVMEstimator`, to resume a long count
+after a restart or to ship a sketch to another process.
+
+A checkpoint is a fixed size header followed by the memory slots:
+- the header (little endian, see `HEADER`): magic, format version, flags
+  (the estimator options), memory size, round, elements seen, the state of
+  the coins (regular sequences, bit pool, skip counter), `gauss_next` of the
+  RNG, the accuracy target (see `CVMEstimator.for_accuracy`), the salt
+  of the key coins and the top of the stack of the empty slots
+- the Mersenne Twister state of the RNG: 624 + 1 (position) + 1 (padding) uint32
+- the memory slots: `memory_size` uint64, as in `HashedSlotMemory`: hashes,
+  and below `FIRST_KEY` the links of the stack of the empty slots (it decides
+  which slot the next elements take)
+
+Only estimators with `hashed_memory=True` can be saved, since the slots are
+stored as fixed-width hashes. Reading a checkpoint goes through a
+`memoryview` of the buffer (an mmap for files): nothing is copied but the
+slots, once, into the memory of the new estimator.
+"""
+import math
+import mmap
+import os
+import struct
+from array import array
+from typing import Union
+
+from cvm_estimator import CVMEstimator, HashedSlotMemory
+
+CHECKPOINT_MAGIC = b'CVMC'
+CHECKPOINT_VERSION = 4
+
+HEADER = struct.Struct(
+    '<'
+    '4s'  # magic
+    'H'   # version
+    'H'   # flags
+    'Q'   # memory size
+    'Q'   # round k
+    'Q'   # elements seen
+    'Q'   # position in the sequence of the regular sampling coin
+    'Q'   # position in the sequence of the regular pruning coin
+    'Q'   # bit pool, low 64 bits
+    'Q'   # bit pool, high 64 bits
+    'Q'   # bits left in the bit pool
+    'Q'   # skip counter
+    'd'   # gauss_next of the RNG, NaN for None
+    'd'   # epsilon of the accuracy target
+    'd'   # delta of the accuracy target
+    'Q'   # max stream length of the accuracy target, 0 for no target
+    'Q'   # salt of the key coins
+    'Q'   # top of the stack of the empty slots, slot index + 1 (0 if the memory is full)
+)
+RNG_STATE_SIZE = 626
+RNG_STATE_OFFSET = HEADER.size
+SLOTS_OFFSET = RNG_STATE_OFFSET + 4 * RNG_STATE_SIZE
+
+# flags
+BATCH_PRUNE = 1
+FAIR_COINS = 2
+SKIP_AHEAD = 4
+HASHED_MEMORY = 8
+RESAMPLE_REPEATS = 16
+KEY_COINS = 32
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+def _flags(estimator: CVMEstimator) -> int:
+    return (
+        BATCH_PRUNE * estimator.batch_prune
+        | FAIR_COINS * estimator.fair_coins
+        | SKIP_AHEAD * estimator.skip_ahead
+        | HASHED_MEMORY * estimator.hashed_memory
+        | RESAMPLE_REPEATS * estimator.resample_repeats
+        | KEY_COINS * estimator.key_coins
+    )
+
+
+def dumps(estimator: CVMEstimator) -> bytes:
+    "The checkpoint of `estimator`."
+    if not estimator.hashed_memory:
+        raise ValueError('Only estimators with hashed_memory=True can be checkpointed')
+
+    if estimator.fair_coins:
+        k_coin_index = one_coin_index = 0
+        pool_bits, pool_n_bits = estimator._coin_pool._bits, estimator._coin_pool._n_bits
+    else:
+        k_coin_index, one_coin_index = estimator.k_coin_tosser._index, estimator.one_coin_pgen._index
+        pool_bits = pool_n_bits = 0
+    skip = estimator._skip_sampler.skip if estimator.skip_ahead else 0
+    epsilon, delta, max_stream_len = estimator.target or (0., 0., 0)
+
+    _, mt_state, gauss_next = estimator.rng.getstate()
+    header = HEADER.pack(
+        CHECKPOINT_MAGIC,
+        CHECKPOINT_VERSION,
+        _flags(estimator),
+        estimator.memory_size,
+        estimator.round_k,
+        estimator.n_seen,
+        k_coin_index,
+        one_coin_index,
+        pool_bits & (2**64 - 1),
+        pool_bits >> 64,
+        pool_n_bits,
+        skip,
+        math.nan if gauss_next is None else gauss_next,
+        epsilon,
+        delta,
+        max_stream_len,
+        estimator.coin_salt,
+        estimator.memory._free_top,
+    )
+    rng_state = array('I', mt_state + (0,) * (RNG_STATE_SIZE - len(mt_state)))
+    return b''.join((header, rng_state.tobytes(), estimator.memory.slots.tobytes()))
+
+
+def _header(buffer: Buffer) -> tuple:
+    header = HEADER.unpack_from(buffer)
+    if header[0] != CHECKPOINT_MAGIC:
+        raise ValueError('Not a CVM checkpoint')
+    if header[1] != CHECKPOINT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version {header[1]} (expected {CHECKPOINT_VERSION})')
+    return header
+
+
+def slots_view(buffer: Buffer) -> memoryview:
+    "The memory slots of a checkpoint, as a uint64 view of `buffer` (no copy); see `HashedSlotMemory`."
+    memory_size = _header(buffer)[3]
+    return memoryview(buffer)[SLOTS_OFFSET:SLOTS_OFFSET + 8 * memory_size].cast('Q')
+
+
+def loads(buffer: Buffer) -> CVMEstimator:
+    "Rebuild the estimator saved in a checkpoint, ready to resume."
+    (
+        _, _, flags, memory_size, round_k, n_seen,
+        k_coin_index, one_coin_index, pool_bits_lo, pool_bits_hi, pool_n_bits, skip, gauss_next,
+        epsilon, delta, max_stream_len, coin_salt, free_top,
+    ) = _header(buffer)
+
+    estimator = CVMEstimator(
+        memory_size,
+        batch_prune=bool(flags & BATCH_PRUNE),
+        fair_coins=bool(flags & FAIR_COINS),
+        skip_ahead=bool(flags & SKIP_AHEAD),
+        hashed_memory=True,
+        resample_repeats=bool(flags & RESAMPLE_REPEATS),
+        key_coins=bool(flags & KEY_COINS),
+    )
+    estimator.coin_salt = coin_salt
+    if max_stream_len:
+        estimator.target = (epsilon, delta, max_stream_len)
+    estimator._set_round(round_k)
+    estimator.n_seen = n_seen
+    estimator.memory = HashedSlotMemory.from_slots(slots_view(buffer), free_top)
+
+    # the coins, after `_set_round` since it can use the RNG
+    mt_state = memoryview(buffer)[RNG_STATE_OFFSET:SLOTS_OFFSET].cast('I')
+    estimator.rng.setstate((3, tuple(mt_state[:625]), None if math.isnan(gauss_next) else gauss_next))
+    if estimator.fair_coins:
+        estimator._coin_pool._bits = pool_bits_lo | pool_bits_hi << 64
+        estimator._coin_pool._n_bits = pool_n_bits
+    else:
+        estimator.k_coin_tosser._index = k_coin_index
+        estimator.one_coin_pgen._index = one_coin_index
+    if estimator.skip_ahead:
+        estimator._skip_sampler.skip = skip
+    return estimator
+
+
+def save_checkpoint(estimator: CVMEstimator, path) -> None:
+    "Write the checkpoint of `estimator` to `path`, atomically (a crash leaves the previous one)."
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(dumps(estimator))
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path) -> CVMEstimator:
+    "Rebuild the estimator saved in the checkpoint file at `path` (memory-mapped)."
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return loads(mm)
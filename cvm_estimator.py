@@ -0,0 +1,812 @@
+"""Headless implementation of the CVM algorithm.
+
+Nothing in here depends on manim, so the estimator can be used to count
+distinct items in arbitrary (and arbitrarily long) iterables. The `CVM` scene
+in `cvm.py` drives the very same object step by step while animating it.
+"""
+import math
+import random
+import struct
+from array import array
+from hashlib import blake2b
+from functools import partial
+from itertools import compress
+from operator import is_not
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+
+class RegularCoinSequenceTosser:
+    """
+    Create a non-random coin tosser that returns a sequence of k heads
+    at regular intervals.
+
+    If k = 1, then we generate 1H every 2**1 tosses.
+    If k = 2, then we generate 2H every 2**2 tosses.
+    ...
+
+    The idea is that since it is only a simulation,
+    if the coin behaves as expected it helps understanding its implied probability.
+    """
+
+    def __init__(self, k, rng=random) -> None:
+        self.k = k
+        self._mod = 2**k
+        self._index = 0
+        self._g_index = 0
+        self._rng = rng
+
+    def toss(self) -> int:
+        "Toss the coin one more time. Return 0 (tails) or 1 (heads)"
+
+        if self.k == 0:
+            return 1
+
+        self._index += 1
+        self._g_index = (self._index - 1) // self.k
+
+        if (self._g_index + 1) % self._mod == 0:
+            return 1
+
+        is_last_el = (self._index % self.k) == 0
+        if is_last_el:
+            return 0
+
+        return self._rng.choice((0, 1))
+
+    def toss_k_heads(self, k) -> bool:
+        "Toss at most k coins, stopping at the first tail. Return True if they are all heads."
+        return all(self.toss() for _ in range(k))
+
+
+class BitPoolCoinTosser:
+    """
+    Fair coin for headless runs: the tosses are the bits of one
+    `getrandbits(64)` call, served from a pool until it runs out,
+    instead of one RNG call per toss.
+    """
+
+    POOL_SIZE = 64
+
+    def __init__(self, rng=random) -> None:
+        self._rng = rng
+        self._bits = 0
+        self._n_bits = 0
+
+    def _take(self, n: int) -> int:
+        "The next n (at most POOL_SIZE) tosses, as the bits of an int (1 = heads)."
+        if n > self._n_bits:
+            # keep the leftover bits and refill on top of them
+            self._bits |= self._rng.getrandbits(self.POOL_SIZE) << self._n_bits
+            self._n_bits += self.POOL_SIZE
+        bits = self._bits & ((1 << n) - 1)
+        self._bits >>= n
+        self._n_bits -= n
+        return bits
+
+    def toss(self) -> int:
+        "Toss the coin one more time. Return 0 (tails) or 1 (heads)"
+        return self._take(1)
+
+    def toss_k_heads(self, k) -> bool:
+        "Toss k coins at once. Return True if they are all heads."
+        while k > 0:
+            n = min(k, self.POOL_SIZE)
+            if self._take(n) != (1 << n) - 1:
+                return False
+            k -= n
+        return True
+
+
+class GeometricSkipSampler:
+    """
+    Sample elements with probability p without tossing a coin per element:
+    `skip`, the number of elements to reject before the next accepted one,
+    is drawn from a geometric distribution, so a rejected element only costs
+    a counter decrement. Since the distribution is memoryless, `skip` can be
+    redrawn whenever p changes.
+    """
+
+    def __init__(self, p: float = 1., rng=random) -> None:
+        self._rng = rng
+        self.set_p(p)
+
+    def set_p(self, p: float) -> None:
+        "Change the sampling probability (and redraw `skip`)."
+        self._log_q = math.log1p(-p) if p < 1 else None
+        self.skip = self.draw_skip()
+
+    def draw_skip(self) -> int:
+        "Number of failures before the first success, each element being sampled with probability p."
+        if self._log_q is None:
+            return 0
+        # 1 - random() is in (0, 1], so the log is finite
+        return int(math.log(1. - self._rng.random()) / self._log_q)
+
+    def sample(self) -> bool:
+        "Whether the next element is sampled."
+        if self.skip:
+            self.skip -= 1
+            return False
+        self.skip = self.draw_skip()
+        return True
+
+
+# translation table from the b'0' / b'1' characters to the 0 / 1 bytes
+_BIT_CHARS_TO_BYTES = bytes.maketrans(b'01', bytes([0, 1]))
+
+
+class SlotMemory:
+    """
+    Fixed size memory where every element sits in a numbered slot,
+    so that a scene can keep addressing the box drawn for each slot.
+
+    Membership, insertion, eviction and size are all O(1):
+    - `slots` holds the elements by position (`None` meaning empty)
+    - `_index` maps each element to its slot
+    - `_free` is a stack of empty slots; it is built (and refilled by the
+      backwards pruning pass) so that its top is always the lowest empty slot,
+      i.e. the same slot `slots.index(None)` would return
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.slots: List[Optional[Hashable]] = [None for _ in range(size)]
+        self._index: Dict[Hashable, int] = {}
+        self._free: List[int] = list(reversed(range(size)))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._index
+
+    def __iter__(self) -> Iterator[Hashable]:
+        "Iterate over the elements in memory, in slot order."
+        return (item for item in self.slots if item is not None)
+
+    @property
+    def is_full(self) -> bool:
+        return not self._free
+
+    @property
+    def members(self):
+        "A container of the elements in memory, for the fastest `in` checks."
+        return self._index
+
+    def slot_of(self, item: Hashable) -> Optional[int]:
+        "Return the slot holding `item`, or None if it is not in memory."
+        return self._index.get(item)
+
+    def insert(self, item: Hashable) -> int:
+        "Place `item` in the next empty slot and return the slot index."
+        ix = self._free.pop()
+        self.slots[ix] = item
+        self._index[item] = ix
+        return ix
+
+    # the elements are their own keys (see `HashedSlotMemory`)
+    insert_key = insert
+
+    def evict(self, ix: int) -> None:
+        "Empty slot `ix`."
+        del self._index[self.slots[ix]]
+        self.slots[ix] = None
+        self._free.append(ix)
+
+    def compact(self, keep: Iterable) -> None:
+        """Keep only the slots whose flag in `keep` is truthy and move the
+        survivors, in order, to the first slots (empty slots flagged to be kept
+        stay empty). Everything runs in C loops (`compress`, `filter`,
+        `dict.update(zip(...))`), there is no per-slot Python code."""
+        survivors = list(filter(partial(is_not, None), compress(self.slots, keep)))
+        n_survivors = len(survivors)
+        # update in place: callers may hold references to these containers
+        self.slots[:] = survivors + [None] * (self.size - n_survivors)
+        self._index.clear()
+        self._index.update(zip(survivors, range(n_survivors)))
+        self._free[:] = range(self.size - 1, n_survivors - 1, -1)
+
+
+# hashes are never below this: smaller values in the slots of a `HashedSlotMemory` are empty slots
+FIRST_KEY = 2**32
+
+
+def hash64(item: Hashable) -> int:
+    """Stable (across processes and runs) 64-bit hash of an item, never below `FIRST_KEY`.
+
+    Items that are equal in Python hash the same, as they are the same key in
+    a `SlotMemory`: `True`, `1` and `1.0` are all the int 1. Otherwise str,
+    bytes, int, float and the other items (hashed through their `repr`) are
+    tagged with their type, so `'abc'` and `b'abc'` do not collide."""
+    if isinstance(item, float) and item.is_integer():
+        item = int(item)
+    if isinstance(item, str):
+        data = b's' + item.encode('utf-8', 'surrogatepass')
+    elif isinstance(item, int):
+        data = b'i' + item.to_bytes((item.bit_length() + 8) // 8, 'little', signed=True)
+    elif isinstance(item, float):
+        data = b'f' + struct.pack('<d', item)
+    elif isinstance(item, (bytes, bytearray, memoryview)):
+        data = b'b' + bytes(item)
+    else:
+        data = b'r' + repr(item).encode()
+    key = int.from_bytes(blake2b(data, digest_size=8).digest(), 'little')
+    return key if key >= FIRST_KEY else key | 1 << 63
+
+
+class HashedSlotMemory:
+    """
+    Same as `SlotMemory`, but the slots hold a 64-bit hash of the elements
+    (`hash64`) instead of the elements, so the footprint does not depend on
+    how big the elements are (URLs, user IDs...), 14 bytes per slot:
+    - `slots` is an `array('Q')` of hashes: 8 bytes per slot. The empty slots
+      hold the stack of empty slots of `SlotMemory` as a linked list: each one
+      holds the index + 1 of the empty slot below it (0 for the bottom one) and
+      `_free_top` is the index + 1 of the top one (0 when the memory is full)
+    - `_table` is an open-addressing (linear probing) hash table of
+      `array('I')` entries, each the slot index + 1 (0 meaning empty),
+      with 1.5 entries per slot: 6 bytes per slot
+    Two elements with the same hash count as one, which for 64-bit hashes
+    only matters with billions of elements in memory.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.slots = array('Q', bytes(8 * size))
+        self._n_table = 3 * size // 2 + 1
+        self._table = array('I', bytes(4 * self._n_table))
+        self._stack_empty_slots(0)
+        self._n_items = 0
+
+    def _stack_empty_slots(self, start: int) -> None:
+        "Make the slots from `start` on the (only) empty ones, the lowest on top."
+        slots = self.slots
+        for ix in range(start, self.size):
+            slots[ix] = ix + 2
+        if start < self.size:
+            slots[self.size - 1] = 0
+        self._free_top = start + 1 if start < self.size else 0
+
+    def __len__(self) -> int:
+        return self._n_items
+
+    def __contains__(self, item: Hashable) -> bool:
+        return self._find(hash64(item)) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        "Iterate over the hashes in memory, in slot order."
+        return (key for key in self.slots if key >= FIRST_KEY)
+
+    @property
+    def is_full(self) -> bool:
+        return not self._free_top
+
+    @property
+    def members(self):
+        return self
+
+    @property
+    def keys(self) -> List[int]:
+        "The hashes by slot, 0 meaning empty."
+        return [key if key >= FIRST_KEY else 0 for key in self.slots]
+
+    def _find(self, key: int) -> Optional[int]:
+        "The table position holding `key`, None if it is not in memory."
+        table, slots, n_table = self._table, self.slots, self._n_table
+        pos = key % n_table
+        while table[pos]:
+            if slots[table[pos] - 1] == key:
+                return pos
+            pos += 1
+            if pos == n_table:
+                pos = 0
+        return None
+
+    def slot_of(self, item: Hashable) -> Optional[int]:
+        "Return the slot holding `item`, or None if it is not in memory."
+        pos = self._find(hash64(item))
+        return None if pos is None else self._table[pos] - 1
+
+    def insert(self, item: Hashable) -> int:
+        "Place `item` in the next empty slot and return the slot index."
+        return self.insert_key(hash64(item))
+
+    def insert_key(self, key: int) -> int:
+        "Place an element, given its hash, in the next empty slot and return the slot index."
+        if not self._free_top:
+            # as the pop of the stack of `SlotMemory`
+            raise IndexError('insert into a full memory')
+        ix = self._free_top - 1
+        self._free_top = self.slots[ix]
+        self._put(key, ix)
+        return ix
+
+    def _put(self, key: int, ix: int) -> None:
+        "Place `key` in the (empty) slot `ix` and index it."
+        self.slots[ix] = key
+        table, n_table = self._table, self._n_table
+        pos = key % n_table
+        while table[pos]:
+            pos += 1
+            if pos == n_table:
+                pos = 0
+        table[pos] = ix + 1
+        self._n_items += 1
+
+    @classmethod
+    def from_slots(cls, slots: Iterable[int], free_top: Optional[int] = None) -> 'HashedSlotMemory':
+        """Rebuild a memory from its slots, every element staying in its slot.
+        With `free_top` the empty slots are linked as in `slots`, starting from
+        it; otherwise they are stacked anew, the lowest on top."""
+        slots = array('Q', slots)
+        memory = cls(len(slots))
+        memory.slots = slots
+        for ix, key in enumerate(slots):
+            if key >= FIRST_KEY:
+                memory._put(key, ix)
+        if free_top is None:
+            free_top = 0
+            for ix in reversed(range(len(slots))):
+                if slots[ix] < FIRST_KEY:
+                    slots[ix], free_top = free_top, ix + 1
+        memory._free_top = free_top
+        return memory
+
+    def evict(self, ix: int) -> None:
+        "Empty slot `ix`."
+        table, slots, n_table = self._table, self.slots, self._n_table
+        hole = self._find(slots[ix])
+        # backward shift deletion: move back the entries of the probe run
+        # that can't be found anymore once the hole is there
+        pos = hole
+        while True:
+            pos += 1
+            if pos == n_table:
+                pos = 0
+            if not table[pos]:
+                break
+            home = slots[table[pos] - 1] % n_table
+            if (hole < home <= pos) if hole <= pos else (hole < home or home <= pos):
+                continue
+            table[hole] = table[pos]
+            hole = pos
+        table[hole] = 0
+        slots[ix], self._free_top = self._free_top, ix + 1
+        self._n_items -= 1
+
+    def compact(self, keep: Iterable) -> None:
+        """Keep only the slots whose flag in `keep` is truthy and move the
+        survivors, in order, to the first slots; the table is rebuilt."""
+        survivors = [key for key in compress(self.slots, keep) if key >= FIRST_KEY]
+        self._table = array('I', bytes(4 * self._n_table))
+        self._n_items = 0
+        for ix, key in enumerate(survivors):
+            self._put(key, ix)
+        self._stack_empty_slots(len(survivors))
+
+
+_MASK64 = 2**64 - 1
+
+
+def _mix64(h: int) -> int:
+    "Scramble the bits of a 64-bit int (the splitmix64 finalizer)."
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return h ^ (h >> 31)
+
+
+def required_memory_size(epsilon: float, delta: float, max_stream_len: int) -> int:
+    """The memory size (threshold) the CVM paper needs to estimate, with probability
+    at least 1 - delta, the distinct elements of a stream of at most `max_stream_len`
+    elements within a factor 1 ± epsilon: ceil(12 / epsilon^2 * log2(8 * max_stream_len / delta))."""
+    if not (0 < epsilon < 1 and 0 < delta < 1):
+        raise ValueError(f'epsilon and delta must be in (0, 1), got {epsilon} and {delta}')
+    if max_stream_len < 1:
+        raise ValueError(f'max_stream_len must be positive, got {max_stream_len}')
+    return math.ceil(12 / epsilon**2 * math.log2(8 * max_stream_len / delta))
+
+
+class CVMEstimator:
+    """
+    Distinct elements estimator following the CVM algorithm, with the same
+    memory layout and coin semantics as the animation:
+    - the memory is a `SlotMemory` of `memory_size` slots
+    - a new element enters the first empty slot if `round_k` coins are all heads
+    - when the memory is full, every slot (from the last to the first) tosses a
+      coin and is emptied on tails; the pass is repeated until something is
+      removed, then the round advances and p halves
+    - the estimate is |X| / p
+
+    The single steps (`lookup`, `toss_sampling_coins`, `insert`, `prune_slot`,
+    `advance_round`) are public so that a scene can interleave them with its
+    animations; `update` and `update_many` chain them for headless use.
+
+    With `batch_prune=True` the memory is pruned in a single batch operation:
+    the coins of all the slots are drawn at once as the bits of one
+    `getrandbits` call and the survivors are compacted to the first slots.
+    This is meant for headless runs with large memories: the survivors
+    change slot, so a scene should not use it.
+
+    With `fair_coins=True` all the coins are fair and come from a single
+    `BitPoolCoinTosser`, instead of the regular sequences that make the
+    animation easier to follow.
+
+    With `skip_ahead=True` (it needs `fair_coins=True`) `update` and
+    `update_many` sample the stream with a `GeometricSkipSampler` instead of
+    tossing k coins per new element: at late rounds almost every element is
+    rejected, and then it costs nothing but the membership check.
+
+    With `hashed_memory=True` the memory is a `HashedSlotMemory`: it keeps
+    a 64-bit hash of the elements instead of the elements themselves, and
+    `mem_list` holds the hashes.
+
+    With `resample_repeats=True` the update is the one of the paper: an
+    element already in memory is removed and sampled again. The animation
+    keeps it instead, which is easier to follow but overestimates on streams
+    with many repeats. `for_accuracy` builds an estimator with a guarantee.
+
+    With `key_coins=True` the coins of an element are not tossed but derived
+    from the element itself: its level is the number of leading zeros of its
+    (salted) 64-bit hash, it is sampled if its level is at least k and survives
+    the pruning to round k + 1 if its level is at least k + 1. Every sketch with
+    the same salt (i.e. the same seed) takes the same decision for an element,
+    so sketches of overlapping parts of a stream can be merged (see `merge`);
+    the memory ends up being the same whatever the order of the elements.
+    """
+
+    def __init__(
+        self,
+        memory_size: int,
+        seed: Optional[int] = None,
+        batch_prune: bool = False,
+        fair_coins: bool = False,
+        skip_ahead: bool = False,
+        hashed_memory: bool = False,
+        resample_repeats: bool = False,
+        key_coins: bool = False,
+    ) -> None:
+        if skip_ahead and not fair_coins:
+            raise ValueError('skip_ahead sampling needs fair_coins=True')
+        if skip_ahead and key_coins:
+            raise ValueError('skip_ahead sampling tosses coins, it cannot be used with key_coins=True')
+        self.memory_size = memory_size
+        self.rng = random.Random(seed)
+        self.batch_prune = batch_prune
+        self.fair_coins = fair_coins
+        self.skip_ahead = skip_ahead
+        self.hashed_memory = hashed_memory
+        self.resample_repeats = resample_repeats
+        self.key_coins = key_coins
+        # (epsilon, delta, max_stream_len) of the guarantee, see `for_accuracy`
+        self.target: Optional[Tuple[float, float, int]] = None
+
+        # start with probability 1, round 0
+        self.round_k = 0
+        self.n_seen = 0
+        self.memory = self._new_memory()
+
+        # random events generators
+        self._coin_pool = BitPoolCoinTosser(self.rng) if fair_coins else None
+        self.k_coin_tosser = self._new_k_coin_tosser()  # for the stream
+        # for clearing the memory
+        self.one_coin_pgen = self._coin_pool or RegularCoinSequenceTosser(k=1, rng=self.rng)
+        self._skip_sampler = GeometricSkipSampler(self.p, rng=self.rng) if skip_ahead else None
+        # mixed into the hashes for the key coins, so that different seeds give independent runs
+        self.coin_salt = self.rng.getrandbits(64) if key_coins else 0
+
+    @classmethod
+    def for_accuracy(
+        cls, epsilon: float, delta: float, max_stream_len: int, seed: Optional[int] = None, **kwargs
+    ) -> 'CVMEstimator':
+        """The smallest estimator whose estimate is, with probability at least 1 - delta,
+        within a factor 1 ± epsilon of the distinct elements of any stream of at most
+        `max_stream_len` elements. It uses the paper's update and fair coins;
+        `kwargs` are the other options (e.g. `hashed_memory`)."""
+        estimator = cls(
+            required_memory_size(epsilon, delta, max_stream_len),
+            seed=seed,
+            fair_coins=True,
+            resample_repeats=True,
+            **kwargs,
+        )
+        estimator.target = (epsilon, delta, max_stream_len)
+        return estimator
+
+    def _new_memory(self):
+        return HashedSlotMemory(self.memory_size) if self.hashed_memory else SlotMemory(self.memory_size)
+
+    def _set_round(self, round_k: int) -> None:
+        "Move to round `round_k` and renew the sampling of the stream for the new p."
+        self.round_k = round_k
+        self.k_coin_tosser = self._new_k_coin_tosser()
+        if self.skip_ahead:
+            self._skip_sampler.set_p(self.p)
+
+    def _new_k_coin_tosser(self):
+        "The coin for sampling the stream in the current round."
+        if self.fair_coins:
+            return self._coin_pool
+        return RegularCoinSequenceTosser(k=self.round_k, rng=self.rng)
+
+    @property
+    def round(self) -> int:
+        return self.round_k
+
+    @property
+    def p(self) -> float:
+        "Current sampling probability, (1/2)^k"
+        return 0.5 ** self.round_k
+
+    @property
+    def mem_list(self) -> List[Optional[Hashable]]:
+        "The memory slots, `None` meaning empty (the hashes, 0 meaning empty, with `hashed_memory`)"
+        return self.memory.keys if self.hashed_memory else self.memory.slots
+
+    @property
+    def n_mem_els(self) -> int:
+        "Number of elements currently in memory, i.e. |X|"
+        return len(self.memory)
+
+    @property
+    def is_full(self) -> bool:
+        return self.memory.is_full
+
+    def estimate(self) -> int:
+        "Estimated number of unique elements, |X| / p"
+        return self.n_mem_els * 2**self.round_k
+
+    def guarantee(self) -> Optional[Tuple[float, float]]:
+        """(epsilon, delta) such that `estimate()` is within a factor 1 ± epsilon of the
+        true count with probability at least 1 - delta. None if the estimator was not
+        built with `for_accuracy`, or once it has seen more elements than planned."""
+        if self.target is None:
+            return None
+        epsilon, delta, max_stream_len = self.target
+        if self.n_seen > max_stream_len:
+            return None
+        return epsilon, delta
+
+    ## SINGLE STEPS ############################################################ SINGLE STEPS
+
+    def lookup(self, item: Hashable) -> Optional[int]:
+        "Return the memory slot holding `item`, or None if it is not in memory."
+        return self.memory.slot_of(item)
+
+    def toss_sampling_coins(self) -> List[int]:
+        """Toss at most k coins, stopping at the first tail.
+        The element must be sampled if all the returned tosses are heads."""
+        tosses = []
+        for _ in range(self.round_k):
+            tosses.append(self.k_coin_tosser.toss())
+            if not tosses[-1]:
+                break
+        return tosses
+
+    def insert(self, item: Hashable) -> int:
+        "Place `item` in the first empty slot and return the slot index."
+        return self.memory.insert(item)
+
+    def prune_slot(self, ix: int) -> int:
+        "Toss the pruning coin for slot `ix`, empty it on tails. Return the toss."
+        is_head = self.one_coin_pgen.toss()
+        if not is_head:
+            self.memory.evict(ix)
+        return is_head
+
+    def _hash_level(self, h: int) -> int:
+        "Level of an element given its hash: it is at least k with probability (1/2)^k."
+        return 64 - _mix64(h ^ self.coin_salt).bit_length()
+
+    def _key_level(self, key: Hashable) -> int:
+        "Level of an element in memory (its hash with `hashed_memory`)."
+        return self._hash_level(key if self.hashed_memory else hash64(key))
+
+    def advance_round(self) -> None:
+        "Move to the next round: p halves and the stream coins get one more toss."
+        self._set_round(self.round_k + 1)
+
+    def prune_batch(self) -> None:
+        "Toss the pruning coins of all the slots at once, keep the heads."
+        all_heads = (1 << self.memory_size) - 1
+        # the original algorithm fails if no elements are removed
+        # so redraw the coins until at least one is tails
+        flips = self.rng.getrandbits(self.memory_size)
+        while flips == all_heads:
+            flips = self.rng.getrandbits(self.memory_size)
+        # bit i is the coin of slot i; turn the bits into one byte (0 or 1) per slot
+        keep = format(flips, f'0{self.memory_size}b')[::-1].encode().translate(_BIT_CHARS_TO_BYTES)
+        self.memory.compact(keep)
+
+    def _prune_key_coins(self) -> None:
+        "Keep the elements whose level reaches the next round (at least one is removed)."
+        levels = [self._key_level(key) for key in self.memory.slots]
+        round_k = self.round_k + 1
+        # the original algorithm fails if no elements are removed
+        # so move on to the next round until at least one element is removed
+        while all(level >= round_k for level in levels):
+            round_k += 1
+        self.memory.compact(bytes(level >= round_k for level in levels))
+        self._set_round(round_k)
+
+    def prune(self) -> None:
+        "Prune a full memory (at least one element is removed) and advance the round."
+        if self.key_coins:
+            self._prune_key_coins()
+            return
+        if self.batch_prune:
+            self.prune_batch()
+            self.advance_round()
+            return
+
+        removed_any = False
+        # the original algorithm fails if no elements are removed
+        # so repeat the pass until at least one element is removed
+        while not removed_any:
+            for ix in reversed(range(self.memory_size)):
+                if not self.prune_slot(ix):
+                    removed_any = True
+        self.advance_round()
+
+    ## HEADLESS API ############################################################ HEADLESS API
+
+    def _forget(self, item: Hashable) -> None:
+        """Remove `item` from memory, so that it is sampled again (paper's update).
+        The slot goes on top of the stack of the empty ones, so from then on the
+        elements do not always take the lowest empty slot as in the animation."""
+        self.memory.evict(self.memory.slot_of(item))
+
+    def update(self, item: Hashable) -> None:
+        "Process one element of the stream."
+        self.n_seen += 1
+        if self.key_coins:
+            # sampling again an element would give the same result
+            if item in self.memory or self._hash_level(hash64(item)) < self.round_k:
+                return
+            self.insert(item)
+            if self.is_full:
+                self.prune()
+            return
+        if item in self.memory:
+            if not self.resample_repeats:
+                return
+            self._forget(item)
+        if self.skip_ahead:
+            if not self._skip_sampler.sample():
+                return
+        elif not self.k_coin_tosser.toss_k_heads(self.round_k):
+            return
+        self.insert(item)
+        if self.is_full:
+            self.prune()
+
+    def update_many(self, items: Iterable[Hashable]) -> None:
+        "Process all the elements of an iterable."
+        # same as calling `update` on each item, but the hot path
+        # (the item is already in memory) avoids the method calls
+        if self.skip_ahead:
+            self._update_many_skip_ahead(items)
+            return
+        if self.key_coins:
+            self._update_many_key_coins(items)
+            return
+        mem_index = self.memory.members
+        resample_repeats = self.resample_repeats
+        n_seen = 0
+        for item in items:
+            n_seen += 1
+            if item in mem_index:
+                if not resample_repeats:
+                    continue
+                self._forget(item)
+            if not self.k_coin_tosser.toss_k_heads(self.round_k):
+                continue
+            self.insert(item)
+            if self.is_full:
+                self.prune()
+        self.n_seen += n_seen
+
+    def _update_many_skip_ahead(self, items: Iterable[Hashable]) -> None:
+        "`update_many` where a rejected element only decrements the skip counter."
+        mem_index = self.memory.members
+        resample_repeats = self.resample_repeats
+        sampler = self._skip_sampler
+        n_seen = 0
+        for item in items:
+            n_seen += 1
+            if item in mem_index:
+                if not resample_repeats:
+                    continue
+                self._forget(item)
+            if sampler.skip:
+                sampler.skip -= 1
+                continue
+            sampler.skip = sampler.draw_skip()
+            self.insert(item)
+            if self.is_full:
+                # the new round redraws the skip counter with the new p
+                self.prune()
+        self.n_seen += n_seen
+
+    def _update_many_key_coins(self, items: Iterable[Hashable]) -> None:
+        "`update_many` where the coins of an element come from its hash."
+        mem_index = self.memory.members
+        hash_level = self._hash_level
+        n_seen = 0
+        for item in items:
+            n_seen += 1
+            if item in mem_index:
+                continue
+            if hash_level(hash64(item)) < self.round_k:
+                continue
+            self.insert(item)
+            if self.is_full:
+                self.prune()
+        self.n_seen += n_seen
+
+    ## MERGING ################################################################# MERGING
+
+    def _subsample(self, items: Iterable[Hashable], n_rounds: int) -> List[Hashable]:
+        "Keep each item with probability (1/2)^n_rounds, i.e. if n_rounds coins are all heads."
+        if n_rounds == 0:
+            return list(items)
+        getrandbits = self.rng.getrandbits
+        return [item for item in items if not getrandbits(n_rounds)]
+
+    def _merge_key_coins(self, other: 'CVMEstimator') -> None:
+        "`merge` of two sketches with key coins: the result is the sketch of the whole stream."
+        if not (self.key_coins and other.key_coins) or self.coin_salt != other.coin_salt:
+            raise ValueError('Sketches with key coins can only be merged with the same seed')
+        round_k = max(self.round_k, other.round_k)
+        keys = [key for key in dict.fromkeys([*self.memory, *other.memory]) if self._key_level(key) >= round_k]
+        # a full memory is always pruned, so the union must end up below the size
+        while len(keys) >= self.memory_size:
+            round_k += 1
+            keys = [key for key in keys if self._key_level(key) >= round_k]
+
+        self.memory = self._new_memory()
+        for key in keys:
+            self.memory.insert_key(key)
+        self._set_round(round_k)
+        self.n_seen += other.n_seen
+
+    def merge(self, other: 'CVMEstimator') -> None:
+        """Merge the sketch of `other` (built on a different part of the stream)
+        into this one, as if a single estimator had seen both parts:
+        - both memories are subsampled down to the smaller p
+        - the memories are united
+        - while the union does not fit the memory, it is pruned with fair coins
+          (at least one element removed per pass) and p halves again
+
+        With tossed coins this only holds if no element appears in both parts:
+        an element sampled by both sketches would survive with probability
+        2p - p^2 instead of p. Sketches with `key_coins=True` (and the same seed)
+        take the same decisions for the same element, so their parts can overlap:
+        the merge gives exactly the sketch of the whole stream.
+        """
+        if self.memory_size != other.memory_size:
+            raise ValueError(
+                f'Cannot merge sketches of different memory sizes ({self.memory_size} and {other.memory_size})'
+            )
+        if self.hashed_memory != other.hashed_memory:
+            raise ValueError('Cannot merge a sketch with hashed memory and one without')
+        if self.key_coins or other.key_coins:
+            self._merge_key_coins(other)
+            return
+        round_k = max(self.round_k, other.round_k)
+        union = dict.fromkeys(self._subsample(self.memory, round_k - self.round_k))
+        union.update(dict.fromkeys(self._subsample(other.memory, round_k - other.round_k)))
+        items = list(union)
+
+        # a full memory is always pruned, so the union must end up below the size
+        while len(items) >= self.memory_size:
+            survivors = self._subsample(items, 1)
+            while len(survivors) == len(items):
+                survivors = self._subsample(items, 1)
+            items = survivors
+            round_k += 1
+
+        self.memory = self._new_memory()
+        for key in items:
+            self.memory.insert_key(key)
+        self._set_round(round_k)
+        self.n_seen += other.n_seen
@@ -0,0 +1,83 @@
+"""Sharded distinct counting: every shard is sketched in its own process
+and the partial sketches are merged.
+
+The shards may share elements (e.g. a stream split round-robin): the
+sketches use key coins with the same seed (see `CVMEstimator`), so every
+shard takes the same decision for the same element and the merged sketch
+is exactly the one a single estimator would build over all the shards."""
+import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from typing import Hashable, Iterable, Optional, Sequence
+
+from cvm_estimator import CVMEstimator
+from cvm_streams import iter_file_records
+
+
+def _common_seed(seed: Optional[int]) -> int:
+    "All the shards need the same seed (the same key coins), even when none is given."
+    return random.getrandbits(64) if seed is None else seed
+
+
+def _check_shards(shards: Sequence) -> None:
+    if not shards:
+        raise ValueError('Cannot estimate the distinct elements of no shards')
+
+
+def _merge(a: CVMEstimator, b: CVMEstimator) -> CVMEstimator:
+    a.merge(b)
+    return a
+
+
+def _estimate_shard(shard: Iterable[Hashable], memory_size: int, seed: int) -> CVMEstimator:
+    estimator = CVMEstimator(memory_size, seed=seed, key_coins=True)
+    estimator.update_many(shard)
+    return estimator
+
+
+def _estimate_file_shard(path, delimiter: bytes, memory_size: int, seed: int) -> CVMEstimator:
+    return _estimate_shard(iter_file_records(path, delimiter=delimiter), memory_size, seed)
+
+
+def parallel_estimate(
+    shards: Sequence[Iterable[Hashable]],
+    workers: Optional[int] = None,
+    *,
+    memory_size: int,
+    seed: Optional[int] = None,
+) -> CVMEstimator:
+    """Sketch every shard in a pool of `workers` processes and merge the results.
+    The shards are sent to the workers, so they must be picklable (e.g. lists);
+    use `parallel_estimate_files` to let every worker read its own file."""
+    _check_shards(shards)
+    seed = _common_seed(seed)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        sketches = pool.map(
+            _estimate_shard,
+            shards,
+            [memory_size] * len(shards),
+            [seed] * len(shards),
+        )
+        return reduce(_merge, sketches)
+
+
+def parallel_estimate_files(
+    paths: Sequence,
+    workers: Optional[int] = None,
+    delimiter: bytes = b"\n",
+    *,
+    memory_size: int,
+    seed: Optional[int] = None,
+) -> CVMEstimator:
+    "Same as `parallel_estimate`, where every shard is the records of a local file."
+    _check_shards(paths)
+    seed = _common_seed(seed)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        sketches = pool.map(
+            _estimate_file_shard,
+            paths,
+            [delimiter] * len(paths),
+            [memory_size] * len(paths),
+            [seed] * len(paths),
+        )
+        return reduce(_merge, sketches)
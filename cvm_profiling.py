@@ -0,0 +1,108 @@
+"""Opt-in instrumentation of the render loop.
+
+`RenderProfiler.phase(name)` measures, for the code it wraps:
+- the wall time
+- the number of `play` calls and the number of frames they emitted
+- the number of mobjects in the scene when the phase ends
+- the peak of the memory allocated (tracemalloc) during the phase
+Measures are summed per phase, overall and per round of the algorithm,
+and exported as a JSON report. Phases must not be nested: `start` a phase
+only after the previous one was stopped.
+"""
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict
+
+
+def _new_phase_stats() -> Dict[str, float]:
+    return {
+        'calls': 0,
+        'wall_time': 0.,
+        'plays': 0,
+        'frames': 0,
+        'mobjects': 0,
+        'peak_memory': 0,
+    }
+
+
+class RenderProfiler:
+    """Collect the measures of the phases of a render.
+    A disabled profiler does not measure anything (and costs nothing)."""
+
+    def __init__(self, scene, frame_rate: float, enabled: bool = True) -> None:
+        self.scene = scene
+        self.frame_rate = frame_rate
+        self.enabled = enabled
+        self.round_k = 0
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.rounds: Dict[int, Dict[str, Dict[str, float]]] = {}
+        self._started_tracemalloc = False
+        self._start_time = time.perf_counter()
+
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def _record(self, stats: Dict[str, float], measures: Dict[str, float]) -> None:
+        stats['calls'] += 1
+        for key in ('wall_time', 'plays', 'frames'):
+            stats[key] += measures[key]
+        for key in ('mobjects', 'peak_memory'):
+            stats[key] = max(stats[key], measures[key])
+
+    def start(self, name: str) -> None:
+        "Start measuring the phase `name` (the previous one must be stopped)."
+        if not self.enabled:
+            return
+        renderer = self.scene.renderer
+        tracemalloc.reset_peak()
+        self._current = (name, renderer.num_plays, renderer.time, time.perf_counter())
+
+    def stop(self) -> None:
+        "Stop measuring the current phase and record its measures."
+        if not self.enabled:
+            return
+        name, plays_before, time_before, start = self._current
+        renderer = self.scene.renderer
+        measures = {
+            'wall_time': time.perf_counter() - start,
+            'plays': renderer.num_plays - plays_before,
+            'frames': round((renderer.time - time_before) * self.frame_rate),
+            'mobjects': len(self.scene.get_mobject_family_members()),
+            'peak_memory': tracemalloc.get_traced_memory()[1],
+        }
+        self._record(self.phases.setdefault(name, _new_phase_stats()), measures)
+        round_phases = self.rounds.setdefault(self.round_k, {})
+        self._record(round_phases.setdefault(name, _new_phase_stats()), measures)
+
+    @contextmanager
+    def phase(self, name: str):
+        "Measure the code in the `with` block as the phase `name`."
+        self.start(name)
+        yield
+        self.stop()
+
+    def report(self) -> dict:
+        total = _new_phase_stats()
+        for stats in self.phases.values():
+            total['calls'] += stats['calls']
+            for key in ('wall_time', 'plays', 'frames'):
+                total[key] += stats[key]
+            for key in ('mobjects', 'peak_memory'):
+                total[key] = max(total[key], stats[key])
+        total['elapsed_time'] = time.perf_counter() - self._start_time
+        return {
+            'total': total,
+            'phases': self.phases,
+            'rounds': {str(round_k): phases for round_k, phases in self.rounds.items()},
+        }
+
+    def save(self, path) -> None:
+        "Write the JSON report and stop tracing the memory (if the profiler started it)."
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
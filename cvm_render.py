@@ -0,0 +1,136 @@
+"""Render the `CVM` scene in parallel, one segment per round.
+
+The run is recorded once; it is then split at the round changes and every
+segment is rendered by its own process, starting from the state (memory,
+recap, stream position) the run had at the start of the segment.
+The segments are finally concatenated with ffmpeg.
+
+    python cvm_render.py --quality high_quality --workers 8
+"""
+import argparse
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from manim import Scene, tempconfig
+
+from cvm import MEMORY_SIZE, STREAM_LEN, coalesce_cleanups_from_env, cvm_algorithm, get_stream
+from cvm_trace import Trace, record_trace
+
+
+class CVMSegment(Scene):
+    "The `CVM` scene, restricted to the stream elements in [start_el, stop_el)."
+
+    def __init__(
+        self, trace: Trace, start_el: int, stop_el: int, final_wait: bool, coalesce_cleanups: bool = False, **kwargs
+    ) -> None:
+        self.trace = trace
+        self.start_el = start_el
+        self.stop_el = stop_el
+        self.final_wait = final_wait
+        self.coalesce_cleanups = coalesce_cleanups
+        super().__init__(**kwargs)
+
+    def construct(self):
+        cvm_algorithm(
+            self,
+            n_stream_els=self.trace.n_stream_els,
+            animate_first_n_els=self.stop_el,
+            trace=self.trace,
+            start_el=self.start_el,
+            final_wait=self.final_wait,
+            coalesce_cleanups=self.coalesce_cleanups,
+        )
+
+
+def _render_segment(
+    trace: Trace,
+    ith_segment: int,
+    start_el: int,
+    stop_el: int,
+    final_wait: bool,
+    quality: str,
+    media_dir: str,
+    coalesce_cleanups: bool,
+) -> str:
+    "Render one segment (in a worker process) and return the path of its movie."
+    with tempconfig({
+        'quality': quality,
+        'media_dir': media_dir,
+        'output_file': f'CVM_segment_{ith_segment:03d}',
+        'progress_bar': 'none',
+    }):
+        scene = CVMSegment(trace, start_el, stop_el, final_wait=final_wait, coalesce_cleanups=coalesce_cleanups)
+        scene.render()
+        return str(scene.renderer.file_writer.movie_file_path)
+
+
+def concat_movies(movie_paths: List[str], output) -> None:
+    "Concatenate movies with the same encoding, without re-encoding them."
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as list_file:
+        list_file.writelines(f"file '{Path(p).resolve()}'\n" for p in movie_paths)
+    try:
+        subprocess.run(
+            [
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-f', 'concat', '-safe', '0', '-i', list_file.name,
+                '-c', 'copy', str(output),
+            ],
+            check=True,
+        )
+    finally:
+        Path(list_file.name).unlink()
+
+
+def render_parallel(
+    output='media/videos/cvm/CVM.mp4',
+    workers: Optional[int] = None,
+    quality: str = 'low_quality',
+    media_dir: str = 'media',
+    n_stream_els: int = STREAM_LEN,
+    seed: int = 0,
+    coalesce_cleanups: Optional[bool] = None,
+) -> Path:
+    """Render the `CVM` scene with one process per round segment and
+    return the path of the concatenated movie. `coalesce_cleanups` defaults
+    to the CVM_COALESCE_CLEANUPS environment variable, as for the `CVM` scene."""
+    if coalesce_cleanups is None:
+        coalesce_cleanups = coalesce_cleanups_from_env()
+    trace = record_trace(get_stream(n_stream_els), MEMORY_SIZE, seed=seed)
+    segments = trace.round_segments()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _render_segment,
+                trace, ith_segment, start_el, stop_el,
+                ith_segment == len(segments) - 1,
+                quality, media_dir, coalesce_cleanups,
+            )
+            for ith_segment, (start_el, stop_el) in enumerate(segments)
+        ]
+        movie_paths = [future.result() for future in futures]
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    concat_movies(movie_paths, output)
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='media/videos/cvm/CVM.mp4')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--quality', default='low_quality')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--coalesce-cleanups', action='store_true', default=None,
+        help='merge the cleanup fades into the next animations (default: CVM_COALESCE_CLEANUPS)',
+    )
+    args = parser.parse_args()
+    print(render_parallel(
+        args.output, workers=args.workers, quality=args.quality, seed=args.seed,
+        coalesce_cleanups=args.coalesce_cleanups,
+    ))
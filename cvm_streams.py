@@ -0,0 +1,121 @@
+"""Stream sources for the headless estimator."""
+import mmap
+import os
+import random
+from typing import Iterator, List, Optional, Sequence, TypeVar
+
+from cvm_estimator import CVMEstimator
+
+# how many bytes of the file are split into records at once
+FILE_CHUNK_SIZE = 64 * 1024**2
+
+T = TypeVar('T')
+
+
+def _pick_distinct(length: int, alphabet: Sequence[T], n_distinct: Optional[int], rng: random.Random) -> List[T]:
+    "Choose the values that will appear in the stream, in random order."
+    if n_distinct is None:
+        n_distinct = len(alphabet)
+    if n_distinct > min(length, len(alphabet)) or (length and not n_distinct):
+        raise ValueError(
+            f'Cannot build a stream of {length} elements with exactly {n_distinct} distinct values '
+            f'out of an alphabet of {len(alphabet)}'
+        )
+    # sampling a `range` does not materialize it, so the alphabet can be huge
+    return rng.sample(alphabet, n_distinct)
+
+
+def random_stream(
+    length: int, alphabet: Sequence[T], n_distinct: Optional[int] = None, seed: Optional[int] = None
+) -> List[T]:
+    """A random stream of `length` elements of `alphabet` where exactly
+    `n_distinct` (all the alphabet by default) different values appear.
+
+    Built in one O(length) pass: every chosen value is placed once,
+    the rest is filled with random chosen values, then the stream is shuffled.
+    """
+    rng = random.Random(seed)
+    values = _pick_distinct(length, alphabet, n_distinct, rng)
+    stream = values + rng.choices(values, k=length - len(values))
+    rng.shuffle(stream)
+    return stream
+
+
+def iter_random_stream(
+    length: int, alphabet: Sequence[T], n_distinct: Optional[int] = None, seed: Optional[int] = None
+) -> Iterator[T]:
+    """Same as `random_stream`, but the elements are generated one at a time
+    and only the distinct values are kept in memory.
+
+    Every element is a value not seen yet with probability (values still
+    missing) / (elements still to generate), so the first occurrences end up
+    at random positions and all the values appear; otherwise it is one of the
+    values already seen.
+    """
+    rng = random.Random(seed)
+    values = _pick_distinct(length, alphabet, n_distinct, rng)
+    n_seen_values = 0
+    for n_left in range(length, 0, -1):
+        n_missing = len(values) - n_seen_values
+        if not n_seen_values or rng.random() * n_left < n_missing:
+            n_seen_values += 1
+            yield values[n_seen_values - 1]
+        else:
+            yield values[rng.randrange(n_seen_values)]
+
+
+def iter_file_records(path, delimiter: bytes = b"\n", chunk_size: int = FILE_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the records of a file, separated by `delimiter`, as bytes.
+
+    The file is memory-mapped and split in chunks of about `chunk_size` bytes
+    (cut at the last delimiter of the chunk), so only one chunk of records
+    is alive at any time, whatever the size of the file. Records are never
+    decoded to `str`. A trailing delimiter at the end of the file does not
+    produce an empty record.
+    """
+    if os.path.getsize(path) == 0:
+        # an empty file cannot be memory-mapped
+        return
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        start = 0
+        while start < size:
+            # cut the chunk right after the last delimiter it contains,
+            # growing it if a single record is longer than the chunk
+            end = min(start + chunk_size, size)
+            while end < size:
+                last_delim = mm.rfind(delimiter, start, end)
+                if last_delim != -1:
+                    end = last_delim + len(delimiter)
+                    break
+                end = min(end + chunk_size, size)
+
+            records = mm[start:end].split(delimiter)
+            # the chunk ends with a delimiter (or with the file): drop the empty tail
+            if not records[-1]:
+                records.pop()
+            yield from records
+            start = end
+
+
+def estimate_distinct_file(
+    path,
+    delimiter: bytes = b"\n",
+    *,
+    memory_size: int,
+    seed: Optional[int] = None,
+    chunk_size: int = FILE_CHUNK_SIZE,
+    **estimator_kwargs,
+) -> CVMEstimator:
+    """Run the CVM algorithm over the records of a (possibly huge) local file
+    with constant memory. Return the estimator: `estimate()`, `round` and `p`
+    describe the result.
+
+    The estimator uses fair coins and the paper's update by default;
+    `estimator_kwargs` override them or set the other options of `CVMEstimator`."""
+    estimator = CVMEstimator(memory_size, seed=seed, **{
+        'batch_prune': True, 'fair_coins': True, 'resample_repeats': True, **estimator_kwargs,
+    })
+    estimator.update_many(iter_file_records(path, delimiter=delimiter, chunk_size=chunk_size))
+    return estimator
@@ -0,0 +1,79 @@
+"""Estimate over time of a long headless run, downsampled for plotting.
+
+`record_timeline` runs the estimator over a (possibly very long) stream and
+records, after every element, the estimate |X|/p and the true number of
+distinct elements so far, plus the positions where the round changed.
+`lttb` then picks a fixed number of points (Largest-Triangle-Three-Buckets)
+that keep the shape of a series, so that plotting costs the same whatever
+the length of the stream.
+"""
+from typing import Hashable, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from cvm_estimator import CVMEstimator
+
+
+class Timeline(NamedTuple):
+    estimates: np.ndarray      # |X|/p after every element
+    true_counts: np.ndarray    # distinct elements so far, after every element
+    round_changes: List[int]   # positions of the elements that made the round advance
+
+
+def record_timeline(
+    stream: Iterable[Hashable], n_stream_els: int, memory_size: int, seed: Optional[int] = None
+) -> Timeline:
+    """Run the algorithm (paper's update, fair coins) over the first `n_stream_els`
+    elements of `stream` and record the estimate after every element."""
+    estimator = CVMEstimator(memory_size, seed=seed, batch_prune=True, fair_coins=True, resample_repeats=True)
+    estimates = np.zeros(n_stream_els)
+    true_counts = np.zeros(n_stream_els)
+    round_changes = []
+
+    seen = set()
+    round_k = 0
+    for pos, item in zip(range(n_stream_els), stream):
+        estimator.update(item)
+        seen.add(item)
+        estimates[pos] = estimator.estimate()
+        true_counts[pos] = len(seen)
+        if estimator.round_k != round_k:
+            round_k = estimator.round_k
+            round_changes.append(pos)
+
+    return Timeline(estimates, true_counts, round_changes)
+
+
+def lttb(y: np.ndarray, n_points: int) -> np.ndarray:
+    """Indices of the `n_points` points of the series `y` (x being the index) picked by
+    Largest-Triangle-Three-Buckets: the first and last points, then one point per
+    bucket, the one making the largest triangle with the point picked in the previous
+    bucket and the average of the next bucket. O(len(y)).
+    All the points are picked if there are no more than `n_points`."""
+    if n_points < 3:
+        raise ValueError(f'n_points must be at least 3 (the first, the last and one per bucket), got {n_points}')
+    n = len(y)
+    if n_points >= n:
+        return np.arange(n)
+
+    # n_points - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_points - 1).astype(int)
+    picked = np.empty(n_points, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+
+    a = 0
+    for ith_bucket in range(n_points - 2):
+        start, end = edges[ith_bucket], edges[ith_bucket + 1]
+        if ith_bucket + 2 < len(edges):
+            next_start, next_end = end, edges[ith_bucket + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = (next_start + next_end - 1) / 2
+        avg_y = y[next_start:next_end].mean()
+
+        xs = np.arange(start, end)
+        areas = np.abs((a - avg_x) * (y[start:end] - y[a]) - (a - xs) * (avg_y - y[a]))
+        a = start + int(areas.argmax())
+        picked[ith_bucket + 1] = a
+
+    return picked
@@ -0,0 +1,178 @@
+"""Record-once event trace of a CVM run.
+
+The simulation (all the coin tosses, inserts, prunes and round changes) is
+run once by `record_trace` and stored as a flat list of events; the scene
+then replays the events instead of running the algorithm itself, so the
+visuals can be changed and re-rendered without re-simulating.
+
+Every event is a short list `[kind, pos, *args]`, `pos` being the position
+in the stream of the element that caused it:
+- `[HIT, pos, slot]`: the element is already in memory, in `slot`
+- `[TOSSES, pos, 'HHT']`: the sampling coins tossed for a new element
+- `[INSERT, pos, slot]`: the element is placed in memory, in `slot`
+- `[PRUNE, pos, 'THHTH']`: one pruning pass, the coins in visiting order
+  (from the last slot to the first); tails empty the slot
+- `[ROUND, pos, k]`: the round advances to k
+
+The events only hold stream positions, so a trace also stores a fingerprint
+of the stream it was recorded on: `Trace.validate` checks that it is replayed
+over the same stream and memory size.
+"""
+import hashlib
+import itertools
+import json
+from typing import Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from cvm_estimator import CVMEstimator
+
+TRACE_VERSION = 2
+
+# event kinds
+HIT = 'h'
+TOSSES = 's'
+INSERT = 'i'
+PRUNE = 'p'
+ROUND = 'r'
+
+
+def encode_tosses(tosses: Iterable[int]) -> str:
+    return ''.join('H' if toss else 'T' for toss in tosses)
+
+
+def decode_tosses(tosses: str) -> List[int]:
+    return [int(toss == 'H') for toss in tosses]
+
+
+def _fingerprint_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def _fingerprint_add(hasher, item: Hashable) -> None:
+    hasher.update(repr(item).encode())
+    hasher.update(b'\0')
+
+
+def stream_fingerprint(stream: Iterable[Hashable]) -> str:
+    "A hash of the elements of `stream` (of their repr), in order."
+    hasher = _fingerprint_hasher()
+    for item in stream:
+        _fingerprint_add(hasher, item)
+    return hasher.hexdigest()
+
+
+class Trace:
+    """The events of one run, plus what is needed to interpret them."""
+
+    def __init__(
+        self, memory_size: int, seed: Optional[int], n_stream_els: int, events: List[list], stream_fingerprint: str
+    ) -> None:
+        self.memory_size = memory_size
+        self.seed = seed
+        self.n_stream_els = n_stream_els
+        self.events = events
+        self.stream_fingerprint = stream_fingerprint
+
+    def validate(self, stream: Sequence[Hashable], memory_size: int) -> None:
+        "Raise ValueError if the trace was not recorded over (a prefix of) `stream` with `memory_size` slots."
+        if memory_size != self.memory_size:
+            raise ValueError(f'The trace was recorded with {self.memory_size} memory slots, not {memory_size}')
+        if len(stream) < self.n_stream_els:
+            raise ValueError(f'The trace covers {self.n_stream_els} elements, the stream has only {len(stream)}')
+        if stream_fingerprint(stream[:self.n_stream_els]) != self.stream_fingerprint:
+            raise ValueError('The trace was recorded over a different stream')
+
+    def steps(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, Iterator[list]]]:
+        "Yield `(pos, events)` for every element of the stream in [start, stop)."
+        for pos, step_events in itertools.groupby(self.events, key=lambda e: e[1]):
+            if pos < start:
+                continue
+            if stop is not None and pos >= stop:
+                return
+            yield pos, step_events
+
+    def state_at(self, pos: int) -> Tuple[List[Optional[int]], int]:
+        """Replay the events (no coins involved) to get the state right before
+        the element at `pos`: the memory slots, holding the stream position
+        of the element they contain, and the round k."""
+        slots: List[Optional[int]] = [None] * self.memory_size
+        round_k = 0
+        for kind, e_pos, arg in self.events:
+            if e_pos >= pos:
+                break
+            if kind == INSERT:
+                slots[arg] = e_pos
+            elif kind == PRUNE:
+                for ix, toss in zip(reversed(range(self.memory_size)), arg):
+                    if toss == 'T':
+                        slots[ix] = None
+            elif kind == ROUND:
+                round_k = arg
+        return slots, round_k
+
+    def round_segments(self) -> List[Tuple[int, int]]:
+        """Split the run in `(start, stop)` stream position ranges,
+        a new one starting right after each round change."""
+        starts = [0] + [pos + 1 for kind, pos, _ in self.events if kind == ROUND and pos + 1 < self.n_stream_els]
+        return list(zip(starts, starts[1:] + [self.n_stream_els]))
+
+    def save(self, path) -> None:
+        with open(path, 'w') as f:
+            json.dump(
+                {
+                    'version': TRACE_VERSION,
+                    'memory_size': self.memory_size,
+                    'seed': self.seed,
+                    'n_stream_els': self.n_stream_els,
+                    'events': self.events,
+                    'stream_fingerprint': self.stream_fingerprint,
+                },
+                f,
+                separators=(',', ':'),
+            )
+
+    @classmethod
+    def load(cls, path) -> 'Trace':
+        with open(path) as f:
+            data = json.load(f)
+        if data['version'] != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version {data['version']} (expected {TRACE_VERSION})")
+        return cls(data['memory_size'], data['seed'], data['n_stream_els'], data['events'], data['stream_fingerprint'])
+
+
+def record_trace(stream: Iterable[Hashable], memory_size: int, seed: Optional[int] = None) -> Trace:
+    """Run the algorithm over `stream`, with the same steps as the scene,
+    and record everything that happens."""
+    estimator = CVMEstimator(memory_size, seed=seed)
+    events = []
+    fingerprint = _fingerprint_hasher()
+
+    pos = -1
+    for pos, item in enumerate(stream):
+        estimator.n_seen += 1
+        _fingerprint_add(fingerprint, item)
+
+        slot = estimator.lookup(item)
+        if slot is not None:
+            events.append([HIT, pos, slot])
+            continue
+
+        tosses = estimator.toss_sampling_coins()
+        events.append([TOSSES, pos, encode_tosses(tosses)])
+        if not all(tosses):
+            continue
+
+        events.append([INSERT, pos, estimator.insert(item)])
+        if not estimator.is_full:
+            continue
+
+        # the original algorithm fails if no elements are removed
+        # so repeat the pass until at least one element is removed
+        removed_any = False
+        while not removed_any:
+            flips = [estimator.prune_slot(ix) for ix in reversed(range(memory_size))]
+            events.append([PRUNE, pos, encode_tosses(flips)])
+            removed_any = not all(flips)
+        estimator.advance_round()
+        events.append([ROUND, pos, estimator.round_k])
+
+    return Trace(memory_size, seed, pos + 1, events, fingerprint.hexdigest())
@@ -0,0 +1,108 @@
+"""Distinct count over a sliding window (the last W elements or the last
+T seconds) with the sampling scheme of the CVM algorithm.
+
+The update is the one of the paper: an element seen again is removed from
+memory and sampled again with the current p. Then whether an element is in
+memory only depends on the coins of its last occurrence (and of the prunes
+after it), and every element whose last occurrence is in the window is in
+memory with probability p. So, keeping the time of the last occurrence of
+every element in memory, the elements that left the window can simply be
+dropped, oldest first, and |X| / p estimates the distinct elements in the
+window: nothing has to be recounted when the window slides.
+
+p only halves (when the memory is full), so after a burst of distinct
+elements the estimate stays unbiased but is noisier until the end.
+"""
+import random
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional
+
+from cvm_estimator import BitPoolCoinTosser
+
+
+class SlidingWindowEstimator:
+    """
+    Estimate the distinct elements among the last `window` elements, or among
+    the elements of the last `window_seconds` seconds (exactly one of the two).
+
+    With a time window, `update` takes the timestamp of the element (by default
+    `time.monotonic()`); timestamps must not decrease.
+    """
+
+    def __init__(
+        self,
+        memory_size: int,
+        window: Optional[int] = None,
+        window_seconds: Optional[float] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        if (window is None) == (window_seconds is None):
+            raise ValueError('Pass exactly one of window and window_seconds')
+        self.memory_size = memory_size
+        self.window = window
+        self.window_seconds = window_seconds
+        self.rng = random.Random(seed)
+        self.coins = BitPoolCoinTosser(self.rng)
+
+        self.round_k = 0
+        self.n_seen = 0
+        # element -> time (position or timestamp) of its last occurrence, oldest first
+        self._last_seen: 'OrderedDict[Hashable, float]' = OrderedDict()
+
+    @property
+    def p(self) -> float:
+        "Current sampling probability, (1/2)^k"
+        return 0.5 ** self.round_k
+
+    @property
+    def n_mem_els(self) -> int:
+        return len(self._last_seen)
+
+    def _now(self, timestamp: Optional[float]) -> float:
+        if self.window is not None:
+            # the position of the last element seen
+            return self.n_seen - 1
+        return time.monotonic() if timestamp is None else timestamp
+
+    def _expire(self, now: float) -> None:
+        "Drop the elements whose last occurrence left the window."
+        horizon = now - (self.window if self.window is not None else self.window_seconds)
+        last_seen = self._last_seen
+        while last_seen and next(iter(last_seen.values())) <= horizon:
+            last_seen.popitem(last=False)
+
+    def _prune(self) -> None:
+        "Keep every element with probability 1/2 (at least one is removed) and halve p."
+        # the original algorithm fails if no elements are removed
+        # so repeat the pass until at least one element is removed
+        kept = self._last_seen
+        while len(kept) == len(self._last_seen):
+            kept = OrderedDict((item, seen) for item, seen in self._last_seen.items() if self.coins.toss())
+        self._last_seen = kept
+        self.round_k += 1
+
+    def update(self, item: Hashable, timestamp: Optional[float] = None) -> None:
+        "Process one element of the stream."
+        self.n_seen += 1
+        now = self._now(timestamp)
+        self._expire(now)
+
+        # the last occurrence decides: forget the previous one, sample again
+        self._last_seen.pop(item, None)
+        if self.coins.toss_k_heads(self.round_k):
+            self._last_seen[item] = now
+            if len(self._last_seen) == self.memory_size:
+                self._prune()
+
+    def update_many(self, items: Iterable[Hashable]) -> None:
+        "Process all the elements of an iterable (their timestamp being now, with a time window)."
+        for item in items:
+            self.update(item)
+
+    def estimate(self, timestamp: Optional[float] = None) -> int:
+        """Estimated number of unique elements in the window, |X| / p.
+        With a time window, the window ends at `timestamp` (by default now)."""
+        if self.window_seconds is not None:
+            self._expire(self._now(timestamp))
+        return self.n_mem_els * 2**self.round_k
@@ -0,0 +1,33 @@
+"""Slot memories of the estimator.
+
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cvm_estimator import HashedSlotMemory, SlotMemory
+
+
+def test_compact_keeps_empty_slots_empty():
+    memory = SlotMemory(3)
+    memory.insert('a')
+    memory.compact(b'\1\1\1')
+    assert len(memory) == 1
+    assert None not in memory
+    assert memory.slots == ['a', None, None]
+    assert memory.insert('b') == 1
+
+
+@pytest.mark.parametrize('memory_class', [SlotMemory, HashedSlotMemory])
+def test_insert_into_a_full_memory_raises(memory_class):
+    memory = memory_class(2)
+    memory.insert('a')
+    memory.insert('b')
+    with pytest.raises(IndexError):
+        memory.insert('c')
+    assert len(memory) == 2
+    assert 'a' in memory and 'b' in memory
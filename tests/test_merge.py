@@ -0,0 +1,81 @@
+"""Merging sketches of shards that share elements.
+
+    python -m pytest tests
+"""
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cvm_estimator import CVMEstimator
+from cvm_parallel import parallel_estimate
+
+
+def overlapping_stream(n_els=50_000, n_distinct=10_000, seed=0):
+    rng = random.Random(seed)
+    return [rng.randrange(n_distinct) for _ in range(n_els)]
+
+
+@pytest.mark.parametrize('hashed_memory', [False, True])
+def test_merge_of_overlapping_shards_is_the_sketch_of_the_whole_stream(hashed_memory):
+    stream = overlapping_stream()
+    whole = CVMEstimator(500, seed=1, key_coins=True, hashed_memory=hashed_memory)
+    whole.update_many(stream)
+
+    # round-robin: every shard sees most of the elements
+    sketches = []
+    for ith_shard in range(4):
+        sketch = CVMEstimator(500, seed=1, key_coins=True, hashed_memory=hashed_memory)
+        sketch.update_many(stream[ith_shard::4])
+        sketches.append(sketch)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+
+    assert merged.round_k == whole.round_k
+    assert sorted(merged.memory) == sorted(whole.memory)
+    assert merged.n_seen == len(stream)
+
+
+def test_merge_of_the_same_stream_twice_does_not_double_count():
+    stream = overlapping_stream()
+    true_count = len(set(stream))
+    estimates = []
+    for seed in range(20):
+        a = CVMEstimator(500, seed=seed, key_coins=True)
+        b = CVMEstimator(500, seed=seed, key_coins=True)
+        a.update_many(stream)
+        b.update_many(stream)
+        a.merge(b)
+        estimates.append(a.estimate())
+    assert abs(sum(estimates) / len(estimates) / true_count - 1) < .05
+
+
+def test_parallel_estimate_of_overlapping_shards():
+    stream = overlapping_stream()
+    true_count = len(set(stream))
+    shards = [stream[ith_shard::4] for ith_shard in range(4)]
+    estimates = [parallel_estimate(shards, workers=2, memory_size=500, seed=seed).estimate() for seed in range(5)]
+    assert abs(sum(estimates) / len(estimates) / true_count - 1) < .1
+
+
+def test_parallel_estimate_needs_shards():
+    with pytest.raises(ValueError):
+        parallel_estimate([], memory_size=500)
+
+
+def test_merge_needs_the_same_memory_size():
+    a = CVMEstimator(10, seed=0, key_coins=True)
+    b = CVMEstimator(20, seed=0, key_coins=True)
+    with pytest.raises(ValueError):
+        a.merge(b)
+
+
+def test_key_coins_merge_needs_the_same_seed():
+    a = CVMEstimator(10, seed=0, key_coins=True)
+    b = CVMEstimator(10, seed=1, key_coins=True)
+    with pytest.raises(ValueError):
+        a.merge(b)